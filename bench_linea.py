@@ -0,0 +1,118 @@
+# bench_linea.py
+# -*- coding: utf-8 -*-
+# Офлайн-бенчмарк пайплайна spin_linea.py на локальной заглушке mock_linea.py.
+#
+#   python bench_linea.py --wallets 50 --concurrency 10 --latency 0.05
+#
+# Печатает кошельков/мин, p50/p99 времени на кошелёк, статусы и число запросов
+# по каждому эндпоинту заглушки.
+
+import os
+import sys
+import time
+import asyncio
+import secrets
+import argparse
+import tempfile
+from collections import Counter
+
+from loguru import logger
+from tabulate import tabulate
+
+import mock_linea
+import spin_linea
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def run_bench(wallets=20, concurrency=5, latency=0.0, fail_rate=0.0, block_time=0.5,
+              index_delay=0.5, inactive_rate=0.0, rate_limit=0, confirm="inline", seed=None):
+    server = mock_linea.start_in_thread(latency=latency, fail_rate=fail_rate, block_time=block_time,
+                                       index_delay=index_delay, inactive_rate=inactive_rate,
+                                       rate_limit=rate_limit, seed=seed)
+    urls = mock_linea.base_urls(server)
+    spin_linea.set_endpoints(**urls)
+    spin_linea.DELAY_MIN = spin_linea.DELAY_MAX = 0
+    spin_linea.PRIZE_CONFIRM = confirm
+    spin_linea.PROXY_RETRY_DELAY = 0.2
+    spin_linea.RECEIPT_POLL_INTERVAL = min(spin_linea.RECEIPT_POLL_INTERVAL, block_time / 2)
+    spin_linea.COUNTERS_POLL_INTERVAL = min(spin_linea.COUNTERS_POLL_INTERVAL, max(0.2, index_delay / 2))
+
+    latencies = []
+    orig_spin_wallet = spin_linea.spin_wallet
+
+    def timed_spin_wallet(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return orig_spin_wallet(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - t0)
+
+    keys = ("0x" + secrets.token_hex(32) for _ in range(wallets))
+    collector = spin_linea.RunCollector()
+    spin_linea.spin_wallet = timed_spin_wallet
+    t0 = time.perf_counter()
+    try:
+        asyncio.run(spin_linea.run_wallets_async(keys, [None], concurrency=concurrency,
+                                                 on_result=collector.add, total=wallets))
+    finally:
+        spin_linea.spin_wallet = orig_spin_wallet
+        server.shutdown()
+    elapsed = time.perf_counter() - t0
+
+    return {
+        "wallets": wallets,
+        "concurrency": concurrency,
+        "elapsed_sec": elapsed,
+        "wallets_per_min": wallets / elapsed * 60 if elapsed else 0.0,
+        "p50_sec": percentile(latencies, 50),
+        "p99_sec": percentile(latencies, 99),
+        "statuses": collector.statuses,
+        "requests": Counter(server.state.counts),
+        "run_report": {**collector.close(elapsed), "rate_limits": spin_linea.rate_limit_stats()},
+    }
+
+
+def print_report(rep):
+    print(f"\nКошельков: {rep['wallets']} | concurrency: {rep['concurrency']} | "
+          f"время: {rep['elapsed_sec']:.1f} c")
+    print(f"Кошельков/мин: {rep['wallets_per_min']:.1f} | "
+          f"p50: {rep['p50_sec']:.2f} c | p99: {rep['p99_sec']:.2f} c")
+    print(tabulate(sorted(rep["statuses"].items()), headers=["Статус", "Кол-во"], tablefmt="simple"))
+    rows = sorted(rep["requests"].items(), key=lambda kv: -kv[1])
+    rows.append(["ВСЕГО", sum(rep["requests"].values())])
+    print(tabulate(rows, headers=["Запрос", "Кол-во"], tablefmt="simple"))
+    spin_linea.print_run_summary(rep["run_report"])
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Бенчмарк spin_linea.py на локальной заглушке")
+    ap.add_argument("--wallets", type=int, default=20)
+    ap.add_argument("--concurrency", type=int, default=5)
+    ap.add_argument("--latency", type=float, default=0.0)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--block-time", type=float, default=0.5)
+    ap.add_argument("--index-delay", type=float, default=0.5)
+    ap.add_argument("--inactive-rate", type=float, default=0.0)
+    ap.add_argument("--rate-limit", type=int, default=0, help="лимит заглушки на /hub, запросов/сек")
+    ap.add_argument("--confirm", choices=("inline", "deferred"), default="inline")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--verbose", action="store_true", help="не глушить логи spin_linea")
+    args = ap.parse_args()
+
+    if not args.verbose:
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+
+    # кэши (токены, призы) — во временной папке, чтобы не трогать рабочие
+    os.chdir(tempfile.mkdtemp(prefix="bench_linea_"))
+    report = run_bench(args.wallets, args.concurrency, args.latency, args.fail_rate,
+                       args.block_time, args.index_delay, args.inactive_rate, args.rate_limit,
+                       args.confirm, args.seed)
+    print_report(report)
@@ -0,0 +1,318 @@
+# mock_linea.py
+# -*- coding: utf-8 -*-
+# Локальная заглушка hub-api.linea.build, DynamicAuth и JSON-RPC ноды Linea.
+# Нужна, чтобы гонять spin_linea.py и бенчмарк без живых эндпоинтов.
+#
+#   python mock_linea.py --port 8545 --latency 0.05 --fail-rate 0.01
+#
+# Пути: /dynamic/nonce, /dynamic/verify, /hub/auth, /hub/users/me, /hub/spins,
+#       /hub/spins/today, /hub/prizes/user, /ip (проверка прокси), /rpc (JSON-RPC).
+
+import json
+import time
+import base64
+import random
+import secrets
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import rlp
+from eth_account import Account
+from eth_utils import keccak
+
+CHAIN_ID = 59144
+
+
+def make_jwt(address, ttl):
+    def enc(obj):
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode().rstrip("=")
+    payload = {"sub": address.lower(), "exp": int(time.time() + ttl)}
+    return f"{enc({'alg': 'none', 'typ': 'JWT'})}.{enc(payload)}.{secrets.token_hex(16)}"
+
+
+def jwt_subject(token):
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        js = json.loads(base64.urlsafe_b64decode(payload))
+        if js.get("exp", 0) < time.time():
+            return None
+        return js.get("sub")
+    except Exception:
+        return None
+
+
+class MockState:
+    """Состояние заглушки: пользователи хаба, цепочка и счётчики запросов."""
+
+    def __init__(self, latency=0.0, fail_rate=0.0, block_time=2.0, index_delay=3.0,
+                 spins_per_day=1, prize_rate=0.7, inactive_rate=0.0, balance_wei=10**18,
+                 jwt_ttl=3600, gas_used=120_000, rate_limit=0, seed=None):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.rate_limit = rate_limit  # запросов/сек к /hub, сверх — 429 с Retry-After
+        self.rate_window = (0, 0)     # (секунда, запросов в ней)
+        self.block_time = block_time
+        self.index_delay = index_delay
+        self.spins_per_day = spins_per_day
+        self.prize_rate = prize_rate
+        self.inactive_rate = inactive_rate
+        self.balance_wei = balance_wei
+        self.jwt_ttl = jwt_ttl
+        self.gas_used = gas_used
+        self.rnd = random.Random(seed)
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.users = {}       # address -> dict(activated, todaySpins, plays, streak, prizes)
+        self.nonces = {}      # address -> следующий nonce
+        self.txs = {}         # tx_hash -> dict(from, block, gasPrice)
+        self.pending = []     # (когда проиндексировать, address, tx_hash)
+        self.prize_seq = 0
+
+    # --- общие ---
+    def block_number(self):
+        return int((time.time() - self.started) / self.block_time) + 1
+
+    def user(self, address):
+        address = address.lower()
+        u = self.users.get(address)
+        if u is None:
+            u = {"activated": self.rnd.random() >= self.inactive_rate,
+                 "todaySpins": self.spins_per_day, "plays": 0,
+                 "streak": self.rnd.randint(0, 40), "prizes": []}
+            self.users[address] = u
+        return u
+
+    def settle(self):
+        """Индексатор: применяет спины, чьи транзакции уже «проиндексированы»."""
+        now = time.time()
+        ready = [p for p in self.pending if p[0] <= now]
+        self.pending = [p for p in self.pending if p[0] > now]
+        for _, address, tx_hash in ready:
+            u = self.user(address)
+            u["todaySpins"] = max(0, u["todaySpins"] - 1)
+            u["plays"] += 1
+            if self.rnd.random() < self.prize_rate:
+                self.prize_seq += 1
+                u["prizes"].insert(0, {"id": f"prz_{self.prize_seq}", "title": "LXP",
+                                       "amount": self.rnd.choice([5, 10, 25, 50]),
+                                       "token": "LXP", "txHash": tx_hash})
+
+    # --- JSON-RPC ---
+    def rpc(self, method, params):
+        if method == "eth_chainId":
+            return hex(CHAIN_ID)
+        if method == "net_version":
+            return str(CHAIN_ID)
+        if method == "eth_blockNumber":
+            return hex(self.block_number())
+        if method == "eth_gasPrice":
+            return hex(60_000_000)
+        if method == "eth_maxPriorityFeePerGas":
+            return hex(1_000_000)
+        if method == "eth_estimateGas":
+            return hex(int(self.gas_used * 1.2))
+        if method == "eth_getBalance":
+            return hex(self.balance_wei)
+        if method == "eth_getTransactionCount":
+            return hex(self.nonces.get(params[0].lower(), 0))
+        if method == "eth_sendRawTransaction":
+            return self.send_raw(params[0])
+        if method == "eth_getTransactionReceipt":
+            return self.receipt(params[0])
+        if method == "eth_getBlockByNumber":
+            n = self.block_number() if params[0] in ("latest", "pending") else int(params[0], 16)
+            return {"number": hex(n), "hash": "0x" + keccak(n.to_bytes(8, "big")).hex(),
+                    "timestamp": hex(int(self.started + n * self.block_time)),
+                    "baseFeePerGas": hex(7), "gasLimit": hex(2_000_000_000),
+                    "transactions": [], "extraData": "0x"}
+        raise ValueError(f"method {method} not supported")
+
+    def send_raw(self, raw_hex):
+        raw = bytes.fromhex(raw_hex[2:] if raw_hex.startswith("0x") else raw_hex)
+        sender = Account.recover_transaction(raw).lower()
+        fields = rlp.decode(raw)
+        nonce = int.from_bytes(fields[0], "big")
+        expected = self.nonces.get(sender, 0)
+        if nonce != expected:
+            raise ValueError(f"nonce too low: expected {expected}, got {nonce}")
+        self.nonces[sender] = expected + 1
+        tx_hash = "0x" + keccak(raw).hex()
+        mined = self.block_number() + 1
+        self.txs[tx_hash] = {"from": sender, "block": mined,
+                             "gasPrice": int.from_bytes(fields[1], "big")}
+        index_at = self.started + mined * self.block_time + self.index_delay
+        self.pending.append((index_at, sender, tx_hash))
+        return tx_hash
+
+    def receipt(self, tx_hash):
+        tx = self.txs.get(tx_hash.lower())
+        if not tx or self.block_number() < tx["block"]:
+            return None
+        return {"transactionHash": tx_hash, "transactionIndex": "0x0",
+                "blockHash": "0x" + keccak(tx["block"].to_bytes(8, "big")).hex(),
+                "blockNumber": hex(tx["block"]), "from": tx["from"], "to": None,
+                "gasUsed": hex(self.gas_used), "cumulativeGasUsed": hex(self.gas_used),
+                "effectiveGasPrice": hex(tx["gasPrice"]), "contractAddress": None,
+                "logs": [], "logsBloom": "0x" + "00" * 256, "status": "0x1", "type": "0x0"}
+
+
+class Handler(BaseHTTPRequestHandler):
+    state = None  # MockState, задаётся в make_server
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, code, body, headers=None):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def body(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(n) if n else b""
+
+    def bearer_user(self):
+        auth = self.headers.get("Authorization", "")
+        sub = jwt_subject(auth[7:]) if auth.startswith("Bearer ") else None
+        return sub
+
+    def handle_any(self, method):
+        st = self.state
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        raw = self.body() if method == "POST" else b""
+        with st.lock:
+            st.counts[f"{method} {path}"] += 1
+        if st.latency:
+            time.sleep(st.rnd.uniform(0.5, 1.5) * st.latency)
+        if st.fail_rate and st.rnd.random() < st.fail_rate:
+            return self.reply(503, {"error": "mock failure"})
+        if st.rate_limit and path.startswith("/hub"):
+            with st.lock:
+                sec, n = st.rate_window
+                now = int(time.time())
+                st.rate_window = (now, n + 1 if sec == now else 1)
+                limited = st.rate_window[1] > st.rate_limit
+                if limited:
+                    st.counts["429"] += 1
+            if limited:
+                return self.reply(429, {"message": "Too Many Requests"}, {"Retry-After": "1"})
+
+        if path == "/rpc" and method == "POST":
+            return self.handle_rpc(raw)
+        if path == "/ip":
+            return self.reply(200, {"origin": self.client_address[0]})
+        if path == "/dynamic/nonce":
+            return self.reply(200, {"nonce": secrets.token_hex(16)})
+        if path == "/dynamic/verify" and method == "POST":
+            js = json.loads(raw or b"{}")
+            address = js.get("publicWalletAddress") or ""
+            token = make_jwt(address, st.jwt_ttl)
+            return self.reply(200, {"jwt": token, "minifiedJwt": token})
+
+        address = self.bearer_user()
+        if not address:
+            return self.reply(401, {"message": "Unauthorized"})
+        with st.lock:
+            st.settle()
+            u = st.user(address)
+            if path == "/hub/auth" and method == "POST":
+                u["activated"] = True
+                return self.reply(201, {"ok": True})
+            if not u["activated"]:
+                return self.reply(404, {"message": "User not found"})
+            if path == "/hub/users/me":
+                return self.reply(200, {"address": address, "streak": u["streak"]})
+            if path == "/hub/spins/today":
+                return self.reply(200, {"plays": u["plays"], "todaySpins": u["todaySpins"]})
+            if path == "/hub/spins" and method == "POST":
+                if u["todaySpins"] <= 0:
+                    return self.reply(403, {"message": "You have exhausted your spins for today"})
+                sig = {"r": "0x" + secrets.token_hex(32), "s": "0x" + secrets.token_hex(32), "v": 27}
+                return self.reply(201, {"nonce": st.rnd.randint(1, 2**63),
+                                        "expirationTimestamp": int(time.time()) + 600,
+                                        "boost": 0, "signature": sig})
+            if path == "/hub/prizes/user":
+                q = parse_qs(url.query)
+                skip = int(q.get("skip", ["0"])[0])
+                take = int(q.get("take", ["30"])[0])
+                return self.reply(200, {"data": u["prizes"][skip:skip + take],
+                                        "total": len(u["prizes"]), "skip": skip, "take": take})
+        return self.reply(404, {"message": "not found"})
+
+    def handle_rpc(self, raw):
+        st = self.state
+        req = json.loads(raw)
+        batch = isinstance(req, list)
+        out = []
+        with st.lock:
+            for item in (req if batch else [req]):
+                st.counts[f"rpc {item.get('method')}"] += 1
+                resp = {"jsonrpc": "2.0", "id": item.get("id")}
+                try:
+                    resp["result"] = st.rpc(item.get("method"), item.get("params") or [])
+                except Exception as e:
+                    resp["error"] = {"code": -32000, "message": str(e)}
+                out.append(resp)
+        return self.reply(200, out if batch else out[0])
+
+    def do_GET(self):
+        self.handle_any("GET")
+
+    def do_POST(self):
+        self.handle_any("POST")
+
+
+def make_server(host="127.0.0.1", port=0, **state_kwargs):
+    """Создаёт сервер (port=0 — любой свободный). Состояние доступно как server.state."""
+    state = MockState(**state_kwargs)
+    handler = type("MockHandler", (Handler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def start_in_thread(**kwargs):
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="mock-linea", daemon=True).start()
+    return server
+
+
+def base_urls(server):
+    host, port = server.server_address[:2]
+    base = f"http://{host}:{port}"
+    return {"hub": f"{base}/hub", "dynamic": f"{base}/dynamic",
+            "rpc": f"{base}/rpc", "proxy_check": f"{base}/ip"}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Mock hub-api/DynamicAuth/RPC для spin_linea.py")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8545)
+    ap.add_argument("--latency", type=float, default=0.0, help="средняя задержка ответа, сек")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="доля ответов 503")
+    ap.add_argument("--block-time", type=float, default=2.0)
+    ap.add_argument("--index-delay", type=float, default=3.0, help="задержка индексатора после блока, сек")
+    ap.add_argument("--inactive-rate", type=float, default=0.0, help="доля неактивированных кошельков")
+    ap.add_argument("--rate-limit", type=int, default=0, help="запросов/сек к /hub, сверх — 429 (0 — без лимита)")
+    args = ap.parse_args()
+
+    srv = make_server(args.host, args.port, latency=args.latency, fail_rate=args.fail_rate,
+                      block_time=args.block_time, index_delay=args.index_delay,
+                      inactive_rate=args.inactive_rate, rate_limit=args.rate_limit)
+    print("Mock запущен:", json.dumps(base_urls(srv), indent=2))
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -7,20 +7,109 @@ DELAY_MAX = 45   # сек
 
 # ===== Ретраи для прокси =====
 PROXY_RETRIES = 3
-PROXY_RETRY_DELAY = 5  # сек между попытками
-
+PROXY_RETRY_DELAY = 5  # сек, первая пауза между попытками (дальше x2 с джиттером)
+
+# ===== Пул прокси =====
+PROXY_HEALTH_TTL    = 600  # сек, сколько доверяем результату проверки прокси
+PROXY_DEAD_TTL      = 60   # сек, через сколько перепроверяем прокси, помеченный мёртвым
+PROXY_CHECK_WORKERS = 20   # параллельных проверок прокси на старте
+PROXY_MAX_FAILURES  = 3    # сетевых сбоев подряд, после которых прокси считается мёртвым
+
+# ===== Параллельная обработка =====
+CONCURRENCY = 1  # сколько кошельков крутим одновременно (1 = по очереди, как раньше)
+SHARDS      = 1  # процессов; >1 — ключи и прокси делятся между процессами (на все ядра)
+
+# ===== Общий трекер квитанций и счётчиков =====
+RECEIPT_POLL_INTERVAL  = 1.0  # сек между проверками нового блока
+COUNTERS_POLL_INTERVAL = 6    # сек между тиками опроса /spins/today
+COUNTERS_POLL_BUDGET   = 10   # максимум запросов /spins/today за тик на все кошельки
+
+# ===== Ограничение частоты запросов к хабу и DynamicAuth =====
+RATE_LIMITS  = {"hub": 10.0, "dynamic": 5.0}  # запросов/сек на группу эндпоинтов (на весь прогон,
+                                              # шарды делят поровну); 0 — без лимита
+RATE_BURST   = 5     # запросов подряд после простоя
+RATE_RETRIES = 4     # повторов одного запроса на 429/5xx
+BACKOFF_BASE = 0.5   # сек, первая пауза; дальше x2 с джиттером
+BACKOFF_MAX  = 30    # сек, потолок паузы
+
+# ===== Кэш адресов кошельков =====
+ADDRESS_CACHE_FILE = "addresses_cache.json"  # sha256(ключа) -> адрес; сами ключи не сохраняются
+
+# ===== Кэш токенов DynamicAuth =====
+TOKEN_CACHE_FILE    = "tokens_cache.db"
+TOKEN_CACHE_MIN_TTL = 600  # сек: токен, которому осталось жить меньше, не переиспользуем
+
+# ===== Локальное хранилище призов =====
+PRIZE_DB_FILE = "prizes.db"
+
+# ===== История прогонов (для --report) =====
+HISTORY_DB_FILE = "history.db"
+
+# ===== Пулы HTTP-соединений (общие для хаба и RPC, по одному на прокси) =====
+POOL_CONNECTIONS = 10  # сколько хостов держим в пуле одного прокси
+POOL_MAXSIZE     = 20  # keep-alive соединений на хост
+
+# ===== Кэш данных сети (контракт, газ) =====
+GAS_PRICE_TTL = 10        # сек (~5 блоков Linea), сколько живёт закэшированный gasPrice
+GAS_DEFAULT   = 250_000   # газ participate, если оценить не удалось
+GAS_PRECHECK  = 100_000   # нижняя граница газа для отсева пустых кошельков ещё до авторизации
+RPC_BATCH_SIZE = 100      # адресов в одном JSON-RPC batch при предзагрузке nonce/балансов
+RPC_BATCH_WINDOW = 0.01   # сек: вызовы w3.eth.* разных кошельков за это окно уходят одним batch (0 — выкл.)
+
+# ===== Подтверждение спина =====
+PRIZE_CONFIRM = "inline"  # inline — после квитанции ждём индексатор хаба и сверяем призы;
+                          # deferred — кошелёк освобождается сразу после квитанции, сверка идёт в фоне
+CONTRACT_EVENTS_ABI = []  # ABI событий participate (в комплекте не поставляется, задаётся вручную);
+                          # пока пусто, в deferred призы известны только после фоновой сверки
+
+# ===== Журнал прогона (возобновление после падения) =====
+JOURNAL_FILE = "run_journal.jsonl"
+
+# ===== Режим планировщика (--daemon) =====
+DAEMON_WINDOW_HOURS = 20    # часов после сброса (00:00 UTC), по которым раскидываются кошельки
+DAEMON_RETRY_MAX    = 5     # повторов упавшего кошелька за сутки
+DAEMON_RETRY_BASE   = 300   # сек, первая пауза перед повтором (дальше x2 с джиттером, до часа)
+
+# ===== Логи =====
+LOG_FILE   = "spin_linea.log"
+LOG_LEVEL  = "INFO"   # DEBUG — плюс сырые ответы API на каждый запрос и опрос (очень много строк)
+LOG_FORMAT = "text"   # json — по JSON-строке на запись, с полями wallet и phase
+
+# ===== Отчёт о прогоне =====
+RUN_REPORT_FILE = "run_report.json"
+
+import os
+import sys
+import json
+import heapq
+import hashlib
+import itertools
 import time
+import base64
+import csv
 import random
+import argparse
+import sqlite3
+import functools
+import contextlib
+import contextvars
+import asyncio
+import threading
+import multiprocessing
 import requests
-from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from array import array
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from loguru import logger
 from tabulate import tabulate
 
-from web3 import Web3, HTTPProvider
-from web3.middleware import geth_poa_middleware
 from eth_utils import to_checksum_address
-from eth_account.messages import encode_defunct
-from eth_account import Account
+
+# web3/eth_account — ~1.5 с импорта; грузятся при первом обращении к сети, см. chain_stack()
+Web3 = HTTPProvider = geth_poa_middleware = AttributeDict = TimeExhausted = DISCARD = None
+receipt_formatter = Web3JsonEncoder = encode_defunct = Account = PooledHTTPProvider = None
 
 # ===== Контракт и ABI (участие через participate) =====
 CONTRACT_ADDRESS = to_checksum_address("0xDb3a3929269281F157A58D91289185F21E30A1e0")
@@ -57,44 +146,643 @@ USERS_ME_URL    = "https://hub-api.linea.build/users/me"
 SPINS_URL       = "https://hub-api.linea.build/spins"
 SPINS_TODAY_URL = "https://hub-api.linea.build/spins/today"
 PRIZES_URL      = "https://hub-api.linea.build/prizes/user"
+PROXY_CHECK_URL = "https://httpbin.org/ip"
 REQUEST_ID      = "ae98b9b4-daaf-4bb3-b5e0-3f07175906ed"
 
+def set_endpoints(hub=None, dynamic=None, rpc=None, proxy_check=None):
+    """Перенаправляет эндпоинты (например, на локальный mock_linea.py)."""
+    global LINEA_RPC, NONCE_URL, VERIFY_URL, HUB_AUTH_URL, USERS_ME_URL
+    global SPINS_URL, SPINS_TODAY_URL, PRIZES_URL, PROXY_CHECK_URL
+    if hub:
+        hub = hub.rstrip("/")
+        HUB_AUTH_URL    = f"{hub}/auth"
+        USERS_ME_URL    = f"{hub}/users/me"
+        SPINS_URL       = f"{hub}/spins"
+        SPINS_TODAY_URL = f"{hub}/spins/today"
+        PRIZES_URL      = f"{hub}/prizes/user"
+    if dynamic:
+        dynamic = dynamic.rstrip("/")
+        NONCE_URL  = f"{dynamic}/nonce"
+        VERIFY_URL = f"{dynamic}/verify"
+    if rpc:
+        LINEA_RPC = rpc
+    if proxy_check:
+        PROXY_CHECK_URL = proxy_check
+
+# ===== Замеры (фазы, запросы, ретраи по кошельку) =====
+class WalletMetrics:
+    """Время по фазам, число запросов и ретраев одного кошелька."""
+
+    def __init__(self, idx=None):
+        self.idx = idx
+        self.address = None
+        self.current_phase = None   # для полей wallet/phase в логах
+        self.phases = {}            # фаза -> [секунд, вызовов]
+        self.requests = Counter()   # "GET spins/today" -> n
+        self.retries = Counter()
+        self.total = None
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_phase(self, name, sec):
+        with self._lock:
+            p = self.phases.setdefault(name, [0.0, 0])
+            p[0] += sec
+            p[1] += 1
+
+    def count_request(self, label):
+        with self._lock:
+            self.requests[label] += 1
+
+    def count_retry(self, label):
+        with self._lock:
+            self.retries[label] += 1
+
+    def on_response(self, r, *args, **kwargs):
+        # хук requests.Session: считает каждый ответ хаба/DynamicAuth
+        self.count_request(f"{r.request.method} {endpoint_label(r.url)}")
+
+    def finish(self):
+        self.total = time.perf_counter() - self._t0
+
+    def as_dict(self):
+        return {"total_sec": round(self.total or 0.0, 3),
+                "phases": {k: {"sec": round(v[0], 3), "calls": v[1]} for k, v in self.phases.items()},
+                "requests": dict(self.requests),
+                "retries": dict(self.retries)}
+
+_current_metrics = contextvars.ContextVar("wallet_metrics", default=None)
+
+def endpoint_label(url):
+    base = url.split("?", 1)[0]
+    names = {NONCE_URL: "nonce", VERIFY_URL: "verify", HUB_AUTH_URL: "auth",
+             USERS_ME_URL: "users/me", SPINS_URL: "spins", SPINS_TODAY_URL: "spins/today",
+             PRIZES_URL: "prizes/user", PROXY_CHECK_URL: "proxy-check", LINEA_RPC: "rpc"}
+    return names.get(base, base)
+
+@contextlib.contextmanager
+def phase(name):
+    m = _current_metrics.get()
+    if m is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    outer, m.current_phase = m.current_phase, name
+    try:
+        yield
+    finally:
+        m.current_phase = outer
+        m.add_phase(name, time.perf_counter() - t0)
+
+def timed(name):
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def count_request(label):
+    m = _current_metrics.get()
+    if m is not None:
+        m.count_request(label)
+
+def count_retry(label):
+    m = _current_metrics.get()
+    if m is not None:
+        m.count_retry(label)
+
+def metrics_middleware(make_request, w3):
+    """web3-middleware: считает JSON-RPC вызовы текущего кошелька по методам."""
+    def middleware(method, params):
+        count_request(f"rpc {method}")
+        return make_request(method, params)
+    return middleware
+
+# ===== Логи =====
+def _log_context(record):
+    """patcher loguru: кошелёк и фаза текущего потока — в record["extra"]."""
+    m = _current_metrics.get()
+    if m is not None:
+        record["extra"].setdefault("wallet", m.address or m.idx)
+        record["extra"].setdefault("phase", m.current_phase)
+
+def _json_format(record):
+    data = {"ts": record["time"].isoformat(timespec="milliseconds"),
+            "level": record["level"].name, "msg": record["message"]}
+    data.update((k, v) for k, v in record["extra"].items() if not k.startswith("_"))
+    if record["exception"] is not None:
+        data["exc"] = f"{record['exception'].type.__name__}: {record['exception'].value}"
+    record["extra"]["_json"] = json.dumps(data, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+def setup_logging(fname=None, level=None, fmt=None):
+    """Консоль + файл. В файл пишет фоновый поток (enqueue) — воркеры не ждут диск."""
+    level = level or LOG_LEVEL
+    logger.remove()
+    logger.configure(patcher=_log_context)
+    logger.add(sys.stderr, level=level)
+    extra = {"format": _json_format} if (fmt or LOG_FORMAT) == "json" else {}
+    logger.add(fname or LOG_FILE, level=level, rotation="1 week", enqueue=True,
+               backtrace=False, diagnose=False, **extra)
+
+# ===== Ограничение частоты и backoff =====
+def backoff_delay(attempt, base=None, cap=None):
+    """Экспоненциальная пауза с джиттером: base*2^(attempt-1), половина — случайная."""
+    base = BACKOFF_BASE if base is None else base
+    cap = BACKOFF_MAX if cap is None else cap
+    d = min(cap, base * 2 ** max(0, attempt - 1))
+    return d / 2 + random.uniform(0, d / 2)
+
+def parse_retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    """Token bucket одной группы эндпоинтов, общий для всех потоков процесса.
+
+    На 429 лимит падает вдвое (не ниже 1/8 настроенного), и вся группа ждёт Retry-After
+    (или backoff); каждый успешный ответ понемногу возвращает лимит к настроенному.
+    """
+
+    def __init__(self, name, rate, burst=None):
+        self.name = name
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = burst or RATE_BURST
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.sent = deque()   # моменты запросов за последние 10 с
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.sent.append(now)
+                        while self.sent[0] < now - 10:
+                            self.sent.popleft()
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def ok(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def throttle(self, retry_after=None, attempt=1):
+        """Ответ 429: снижает лимит и ставит группу на паузу; возвращает паузу в секундах."""
+        delay = retry_after if retry_after is not None else backoff_delay(attempt)
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.max_rate / 8, self.rate / 2)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            # после паузы начинаем с пустого ведра, без залпа накопленных запросов
+            self.tokens = 0.0
+            self.updated = self.blocked_until
+        logger.warning(f"429 от {self.name}: лимит {self.rate:.1f} запр/с, пауза {delay:.1f} с")
+        return delay
+
+    def current_rate(self):
+        """Фактическая частота запросов группы за последние 10 с, запр/с."""
+        with self._lock:
+            now = time.monotonic()
+            return sum(1 for t in self.sent if t >= now - 10) / 10
+
+    def stats(self):
+        return {"limit_rps": round(self.rate, 2), "max_rps": self.max_rate,
+                "current_rps": round(self.current_rate(), 2), "throttled": self.throttled}
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(url):
+    """Лимитер группы (hub / dynamic), к которой относится url; None — без лимита."""
+    base = url.split("?", 1)[0]
+    if base.startswith(HUB_AUTH_URL.rsplit("/", 1)[0] + "/"):
+        group = "hub"
+    elif base.startswith(NONCE_URL.rsplit("/", 1)[0] + "/"):
+        group = "dynamic"
+    else:
+        return None
+    rate = RATE_LIMITS.get(group)
+    if not rate:
+        return None
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(group)
+        if limiter is None:
+            limiter = _rate_limiters[group] = RateLimiter(group, rate)
+        return limiter
+
+def rate_limit_stats():
+    return {name: lim.stats() for name, lim in _rate_limiters.items()}
+
 # ===== Данные =====
-def read_lines(fname):
+KEYS_FILE    = "private_keys.txt"
+PROXIES_FILE = "proxies.txt"
+
+def iter_lines(fname):
+    """Непустые строки файла по одной — ключи не держим в памяти целиком."""
     with open(fname, encoding="utf-8") as f:
-        return [x.strip() for x in f if x.strip()]
+        for x in f:
+            x = x.strip()
+            if x:
+                yield x
 
-private_keys = read_lines("private_keys.txt")
-proxies      = read_lines("proxies.txt")
+def read_lines(fname):
+    return list(iter_lines(fname))
+
+def count_lines(fname):
+    return sum(1 for _ in iter_lines(fname))
+
+_address_cache = None
+_address_cache_dirty = False
+_address_lock = threading.Lock()
+
+def _key_id(pk):
+    return hashlib.sha256(pk.lower().removeprefix("0x").encode()).hexdigest()[:32]
+
+def address_of(pk):
+    """Адрес ключа: из ADDRESS_CACHE_FILE или через eth_keys (без импорта web3, ~2 мс на ключ)."""
+    global _address_cache, _address_cache_dirty
+    kid = _key_id(pk)
+    with _address_lock:
+        if _address_cache is None:
+            try:
+                with open(ADDRESS_CACHE_FILE, encoding="utf-8") as f:
+                    _address_cache = json.load(f)
+            except (OSError, ValueError):
+                _address_cache = {}
+        address = _address_cache.get(kid)
+    if address is None:
+        from eth_keys import keys
+        address = keys.PrivateKey(bytes.fromhex(pk.removeprefix("0x"))).public_key.to_checksum_address()
+        with _address_lock:
+            _address_cache[kid] = address
+            _address_cache_dirty = True
+    return address
+
+def save_address_cache():
+    global _address_cache_dirty
+    with _address_lock:
+        if not _address_cache_dirty:
+            return
+        tmp = f"{ADDRESS_CACHE_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_address_cache, f)
+        os.replace(tmp, ADDRESS_CACHE_FILE)
+        _address_cache_dirty = False
+
+class WalletResult:
+    """Итог по кошельку (строка таблицы и results.csv) + замеры прогона."""
+    __slots__ = ("address", "streak", "status", "reward", "metrics", "confirm", "txs", "retryable")
+
+    def __init__(self, address="-", streak=None, status="Ошибка", reward="—", metrics=None, retryable=False):
+        self.address = address
+        self.streak = streak
+        self.status = status
+        self.reward = reward
+        self.metrics = metrics
+        self.retryable = retryable  # сбой временный (сеть, прокси, авторизация) — есть смысл повторить
+        self.confirm = None   # фоновая сверка с хабом (режим deferred), пока не выполнена
+        self.txs = None       # транзакции за сегодня из журнала (для истории)
+
+    def as_row(self):
+        return {"address": self.address, "streak": self.streak,
+                "status": self.status, "reward": self.reward}
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row.get("address", "-"), row.get("streak"), row.get("status", "Ошибка"),
+                   row.get("reward", "—"))
 
 # ===== Вспомогательные =====
+def proxy_dict(proxy):
+    """Словарь proxies для requests; пустой прокси = прямое соединение."""
+    if not proxy:
+        return {}
+    return {"http": f"http://{proxy}", "https": f"http://{proxy}"}
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+              "AppleWebKit/537.36 (KHTML, like Gecko) "
+              "Chrome/118.0.0.0 Safari/537.36")
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+class ProxyTransport(HTTPAdapter):
+    """HTTPAdapter одного прокси: сообщает пулу прокси об удачных и сорванных запросах.
+
+    Запросы к хабу и DynamicAuth проходят через общий RateLimiter группы; ответы 429/5xx
+    повторяются здесь же (до RATE_RETRIES раз) с Retry-After или экспоненциальной паузой.
+    """
+
+    def __init__(self, proxy, **kwargs):
+        super().__init__(**kwargs)
+        self.proxy = proxy
+
+    def send(self, request, **kwargs):
+        limiter = get_rate_limiter(request.url)
+        if limiter is None:
+            return self._send(request, **kwargs)
+        for attempt in range(1, RATE_RETRIES + 2):
+            limiter.acquire()
+            r = self._send(request, **kwargs)
+            if r.status_code != 429 and r.status_code < 500:
+                limiter.ok()
+                return r
+            if attempt > RATE_RETRIES:
+                return r
+            retry_after = parse_retry_after(r.headers.get("Retry-After"))
+            if r.status_code == 429:
+                delay = limiter.throttle(retry_after, attempt)
+            else:
+                delay = retry_after if retry_after is not None else backoff_delay(attempt)
+                logger.warning(f"{endpoint_label(request.url)}: {r.status_code}, повтор через {delay:.1f} с")
+            count_retry(endpoint_label(request.url))
+            r.close()
+            time.sleep(delay)
+
+    def _send(self, request, **kwargs):
+        try:
+            r = super().send(request, **kwargs)
+        except (requests.exceptions.ProxyError, requests.exceptions.ConnectTimeout):
+            # в счёт прокси — только сбои соединения с ним самим; обрывы на стороне хаба/RPC не его вина
+            report_proxy_result(self.proxy, False)
+            raise
+        report_proxy_result(self.proxy, r.status_code != 407)
+        return r
+
+def get_transport(proxy):
+    """Общий HTTPAdapter (пул keep-alive соединений) для данного прокси."""
+    key = proxy or ""
+    with _transports_lock:
+        adapter = _transports.get(key)
+        if adapter is None:
+            adapter = ProxyTransport(proxy, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+            _transports[key] = adapter
+        return adapter
+
+def make_session(proxy):
+    """Новая сессия (свои cookies/заголовки) поверх общего пула соединений прокси."""
+    session = requests.Session()
+    adapter = get_transport(proxy)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.proxies = proxy_dict(proxy)
+    session.headers.update({"User-Agent": USER_AGENT})
+    return session
+
+class RpcBatcher:
+    """Склеивает одновременные JSON-RPC вызовы разных потоков в batch-запросы.
+
+    Первый вызов открывает окно RPC_BATCH_WINDOW и по его истечении отправляет всё,
+    что накопилось (заполненный до RPC_BATCH_SIZE batch уходит сразу). Если других
+    вызовов в полёте нет (например, CONCURRENCY = 1), окно не ждём — запрос уходит сразу.
+    Ответы раздаются вызывающим по id; сетевая ошибка достаётся всем участникам batch.
+    """
+
+    def __init__(self, session, url, timeout=30, window=None, max_size=None):
+        self.session = session
+        self.url = url
+        self.timeout = timeout
+        self.window = RPC_BATCH_WINDOW if window is None else window
+        self.max_size = max_size or RPC_BATCH_SIZE
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._open = None   # текущий набирающийся batch: [(request, waiter)]
+        self._in_flight = 0  # вызовов внутри call() прямо сейчас
+
+    def call(self, method, params):
+        waiter = {"event": threading.Event(), "response": None, "error": None}
+        with self._lock:
+            self._in_flight += 1
+            request = {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+            leader = self._open is None
+            if leader:
+                self._open = []
+            batch = self._open
+            batch.append((request, waiter))
+            # одни в полёте — склеивать не с кем, окно только добавило бы задержку
+            send_now = len(batch) >= self.max_size or (leader and self._in_flight == 1)
+            if send_now:
+                self._open = None
+        try:
+            if send_now:
+                self._send(batch)
+            elif leader:
+                time.sleep(self.window)
+                with self._lock:
+                    mine = self._open is batch
+                    if mine:
+                        self._open = None
+                if mine:
+                    self._send(batch)
+            if not waiter["event"].wait(self.timeout + self.window + 5):
+                raise TimeoutError(f"JSON-RPC {method}: нет ответа batch")
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        if waiter["error"] is not None:
+            raise waiter["error"]
+        return waiter["response"]
+
+    def _send(self, batch):
+        try:
+            payload = [req for req, _ in batch] if len(batch) > 1 else batch[0][0]
+            r = self.session.post(self.url, data=json.dumps(payload, cls=Web3JsonEncoder),
+                                  headers={"Content-Type": "application/json"}, timeout=self.timeout)
+            r.raise_for_status()
+            js = r.json()
+            by_id = {x.get("id"): x for x in (js if isinstance(js, list) else [js])}
+            for req, waiter in batch:
+                resp = by_id.get(req["id"])
+                if resp is None:
+                    waiter["error"] = ValueError(f"JSON-RPC {req['method']}: ответа нет в batch")
+                waiter["response"] = resp
+        except Exception as e:
+            for _, waiter in batch:
+                waiter["error"] = e
+        finally:
+            for _, waiter in batch:
+                waiter["event"].set()
+
+def _define_pooled_provider():
+    class PooledHTTPProvider(HTTPProvider):
+        """HTTPProvider, который ходит в RPC через общий пул соединений прокси.
+
+        Вызовы разных кошельков (потоков) склеиваются RpcBatcher в batch-запросы.
+        """
+
+        def __init__(self, endpoint_uri, proxy=None, timeout=30):
+            super().__init__(endpoint_uri)
+            self.session = make_session(proxy)
+            self.timeout = timeout
+            self.batcher = RpcBatcher(self.session, endpoint_uri, timeout) if RPC_BATCH_WINDOW > 0 else None
+
+        def make_request(self, method, params):
+            if self.batcher is not None:
+                return self.batcher.call(method, params)
+            request_data = self.encode_rpc_request(method, params)
+            r = self.session.post(self.endpoint_uri, data=request_data,
+                                  headers=self.get_request_headers(), timeout=self.timeout)
+            r.raise_for_status()
+            return self.decode_rpc_response(r.content)
+
+    return PooledHTTPProvider
+
+_chain_stack_lock = threading.Lock()
+
+def chain_stack():
+    """Импортирует web3/eth_account при первом обращении к сети; дальше ничего не стоит.
+
+    --plan, --report и предпроверки обходятся без них — старт почти мгновенный.
+    """
+    global Web3, HTTPProvider, geth_poa_middleware, AttributeDict, TimeExhausted, DISCARD
+    global receipt_formatter, Web3JsonEncoder, encode_defunct, Account, PooledHTTPProvider
+    if Account is not None:
+        return
+    with _chain_stack_lock:
+        if Account is not None:
+            return
+        from web3 import Web3, HTTPProvider
+        from web3.middleware import geth_poa_middleware
+        from web3.datastructures import AttributeDict
+        from web3.exceptions import TimeExhausted
+        from web3.logs import DISCARD
+        from web3._utils.method_formatters import receipt_formatter
+        from web3._utils.encoding import Web3JsonEncoder
+        from eth_account.messages import encode_defunct
+        PooledHTTPProvider = _define_pooled_provider()
+        from eth_account import Account  # последним: по нему проверяем, что стек загружен
+
+_web3_cache = {}
+_web3_lock = threading.Lock()
+
 def make_web3(proxy):
-    url = f"http://{proxy}"
-    provider = HTTPProvider(LINEA_RPC, request_kwargs={"proxies": {"http": url, "https": url}})
-    w3 = Web3(provider)
-    w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-    return w3
+    """Web3 для прокси; собирается один раз и переиспользуется всеми его кошельками."""
+    chain_stack()
+    key = (proxy or "", LINEA_RPC)
+    with _web3_lock:
+        w3 = _web3_cache.get(key)
+        if w3 is None:
+            w3 = Web3(PooledHTTPProvider(LINEA_RPC, proxy))
+            w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+            w3.middleware_onion.remove("validation")  # лишний eth_chainId на каждый estimate_gas
+            w3.middleware_onion.add(metrics_middleware, "metrics")
+            _web3_cache[key] = w3
+        return w3
 
 def test_proxy_once(proxy):
-    r = requests.get("https://httpbin.org/ip",
-                     proxies={"http": f"http://{proxy}", "https": f"http://{proxy}"},
-                     timeout=10)
+    count_request("GET proxy-check")
+    r = make_session(proxy).get(PROXY_CHECK_URL, timeout=10)
     ip = r.json().get("origin")
     logger.info(f"Прокси {proxy} работает. IP: {ip}")
 
-def test_proxy_with_retries(proxy, retries=PROXY_RETRIES, delay=PROXY_RETRY_DELAY):
+def test_proxy_with_retries(proxy, retries=PROXY_RETRIES, delay=None):
     for attempt in range(1, retries+1):
+        if attempt > 1:
+            count_retry("proxy")
         try:
             test_proxy_once(proxy)
             return True
         except Exception as e:
             if attempt < retries:
-                logger.warning(f"Прокси {proxy} не ответил (попытка {attempt}/{retries}): {e}. Повтор через {delay}с")
-                time.sleep(delay)
+                pause = backoff_delay(attempt, PROXY_RETRY_DELAY if delay is None else delay)
+                logger.warning(f"Прокси {proxy} не ответил (попытка {attempt}/{retries}): {e}. Повтор через {pause:.1f}с")
+                time.sleep(pause)
             else:
                 logger.error(f"Прокси {proxy} не работает после {retries} попыток: {e}")
                 return False
 
+class ProxyPool:
+    """Здоровье прокси из proxies.txt.
+
+    На старте все прокси проверяются параллельно; результат живёт PROXY_HEALTH_TTL,
+    мёртвый прокси перепроверяется через PROXY_DEAD_TTL. Сбои соединения с самим прокси
+    (через ProxyTransport) после PROXY_MAX_FAILURES подряд помечают его мёртвым, и кошельки
+    уходят на следующий живой. Прямое соединение (None) мёртвым не считается.
+    """
+
+    def __init__(self, proxies):
+        self.proxies = list(proxies)
+        if not self.proxies:
+            logger.warning("Список прокси пуст — работаем напрямую, без прокси")
+            self.proxies = [None]
+        self._lock = threading.Lock()
+        self._state = {}  # proxy -> {"healthy", "checked", "failures"}
+
+    def _set(self, proxy, healthy):
+        with self._lock:
+            self._state[proxy] = {"healthy": healthy, "checked": time.time(), "failures": 0}
+
+    def check_all(self, workers=PROXY_CHECK_WORKERS):
+        unique = list(dict.fromkeys(self.proxies))
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(unique)))) as ex:
+            for proxy, ok in zip(unique, ex.map(test_proxy_with_retries, unique)):
+                self._set(proxy, ok)
+        alive = sum(1 for p in unique if self._state[p]["healthy"])
+        logger.info(f"Живых прокси: {alive}/{len(unique)}")
+        return alive
+
+    def is_healthy(self, proxy):
+        if proxy is None:
+            return True  # прямое соединение: заменить нечем, мёртвым не считаем
+        with self._lock:
+            st = self._state.get(proxy)
+        if st and time.time() - st["checked"] < (PROXY_HEALTH_TTL if st["healthy"] else PROXY_DEAD_TTL):
+            return st["healthy"]
+        ok = test_proxy_with_retries(proxy, retries=1)
+        self._set(proxy, ok)
+        return ok
+
+    def acquire(self, idx):
+        """Прокси для кошелька idx: свой по кругу или следующий живой. LookupError, если живых нет."""
+        n = len(self.proxies)
+        preferred = self.proxies[idx % n]
+        for k in range(n):
+            proxy = self.proxies[(idx + k) % n]
+            if self.is_healthy(proxy):
+                if k:
+                    logger.warning(f"Прокси {preferred} недоступен — используем {proxy}")
+                return proxy
+        raise LookupError("нет живых прокси")
+
+    def report(self, proxy, ok):
+        if proxy is None:
+            return
+        with self._lock:
+            st = self._state.get(proxy)
+            if st is None:
+                return
+            if ok:
+                st["failures"] = 0
+                return
+            st["failures"] += 1
+            if st["healthy"] and st["failures"] >= PROXY_MAX_FAILURES:
+                st["healthy"] = False
+                st["checked"] = time.time()
+                logger.warning(f"Прокси {proxy}: {st['failures']} сбоя подряд — помечен нерабочим")
+
+_proxy_pool = None
+
+def report_proxy_result(proxy, ok):
+    pool = _proxy_pool
+    if pool is not None:
+        pool.report(proxy, ok)
+
 def build_message(address, nonce, issued_at):
     return (
         f"linea.build wants you to sign in with your Ethereum account:\n"
@@ -114,7 +802,7 @@ def get_nonce(session):
                     timeout=15)
     r.raise_for_status()
     js = r.json()
-    logger.info(f"/nonce: {js}")
+    logger.opt(lazy=True).debug("/nonce: {}", lambda: js)
     return js
 
 def get_dynamic_tokens(session, address, signature, message):
@@ -143,6 +831,7 @@ def get_bearer_tokens(session, address, pk):
     n = get_nonce(session)
     issued_at = datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
     msg = build_message(address, n["nonce"], issued_at)
+    chain_stack()
     signature = Account.sign_message(encode_defunct(text=msg), private_key=pk).signature.hex()
     tokens = get_dynamic_tokens(session, address, signature, msg)
     if not (tokens.get("jwt") or tokens.get("minifiedJwt")):
@@ -150,24 +839,158 @@ def get_bearer_tokens(session, address, pk):
     logger.info("Токены готовы (jwt/minified).")
     return tokens
 
+# ===== Кэш токенов (между запусками) =====
+def jwt_expiry(token):
+    """exp из payload JWT (unix-время) или None, если токен не разбирается."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+@contextlib.contextmanager
+def file_lock(path, timeout=30, stale_after=60):
+    """Межпроцессная блокировка через lock-файл (O_EXCL работает и на Windows)."""
+    lock_path = path + ".lock"
+    t0 = time.time()
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)  # хозяин упал, не отпустив блокировку
+                    continue
+            except OSError:
+                pass
+            if time.time() - t0 > timeout:
+                raise TimeoutError(f"Не удалось взять блокировку {lock_path}")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+class TokenStore:
+    """Кэш токенов DynamicAuth (SQLite): строка на адрес со сроком exp из JWT.
+
+    Читается и пишется по одной записи, без перечитывания всего кэша; общий для потоков
+    и процессов-шардов (WAL). Протухшие записи вычищаются при открытии.
+    """
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or TOKEN_CACHE_FILE, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS tokens (
+                                  address TEXT PRIMARY KEY,
+                                  data    TEXT NOT NULL,
+                                  exp     INTEGER NOT NULL)""")
+        self._conn.execute("DELETE FROM tokens WHERE exp <= ?", (time.time() + TOKEN_CACHE_MIN_TTL,))
+        self._conn.commit()
+
+    def get(self, address):
+        with self._lock:
+            row = self._conn.execute("SELECT data, exp FROM tokens WHERE address = ?",
+                                     (address.lower(),)).fetchone()
+        if row is None or row[1] - time.time() <= TOKEN_CACHE_MIN_TTL:
+            return None
+        return json.loads(row[0])
+
+    def put(self, address, tokens):
+        exp = jwt_expiry(tokens.get("jwt") or tokens.get("minifiedJwt") or "")
+        if exp is None:
+            return  # срок не разобрать — такой токен всё равно не переиспользуем
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO tokens (address, data, exp) VALUES (?, ?, ?)",
+                               (address.lower(), json.dumps(tokens), exp))
+            self._conn.commit()
+
+    def drop(self, address):
+        with self._lock:
+            self._conn.execute("DELETE FROM tokens WHERE address = ?", (address.lower(),))
+            self._conn.commit()
+
+_token_store = None
+
+def get_token_store():
+    global _token_store
+    with _singleton_lock:
+        if _token_store is None:
+            _token_store = TokenStore()
+        return _token_store
+
+def get_cached_tokens(address):
+    """Живые токены адреса из кэша или None."""
+    return get_token_store().get(address)
+
+def save_cached_tokens(address, tokens):
+    get_token_store().put(address, tokens)
+
+def drop_cached_tokens(address):
+    get_token_store().drop(address)
+
+def cached_session(session, address):
+    """Кэшированные токены, если хаб их принимает.
+
+    Проверка — один запрос /spins/today, его ответ тоже возвращаем: (tokens, js).
+    js = None, если хаб ответил не 200; (None, None) — кэша нет или токен отклонён.
+    """
+    tokens = get_cached_tokens(address)
+    if not tokens:
+        return None, None
+    status, js = read_spins_today(session, tokens.get("jwt") or tokens.get("minifiedJwt"))
+    if status == 401:
+        logger.warning(f"({address}) Кэшированный токен отклонён (401) — авторизуемся заново.")
+        drop_cached_tokens(address)
+        return None, None
+    logger.info(f"({address}) Токены взяты из кэша.")
+    return tokens, (js if status == 200 else None)
+
+@timed("auth")
+def get_session_tokens(session, address, pk, use_cache=True):
+    """Токены из кэша, если хаб их принимает, иначе полный handshake DynamicAuth.
+
+    use_cache=False — кэш уже проверен (быстрая проверка в spin_wallet), сразу handshake.
+    """
+    if use_cache:
+        tokens, _ = cached_session(session, address)
+        if tokens:
+            return tokens
+    tokens = get_bearer_tokens(session, address, pk)
+    try:
+        save_cached_tokens(address, tokens)
+    except Exception as e:
+        logger.warning(f"({address}) Не удалось сохранить токены в кэш: {e}")
+    return tokens
+
 def activate_user(session, jwt_token):
     headers = {"Authorization": f"Bearer {jwt_token}",
                "Origin": "https://linea.build",
                "Referer": "https://linea.build/"}
     r = session.post(HUB_AUTH_URL, headers=headers, data=b"", timeout=15)
-    logger.info(f"/auth (Bearer jwt; пусто): {r.status_code} {r.text[:200]}")
+    logger.info("/auth (Bearer jwt; пусто): {}", r.status_code)
+    logger.opt(lazy=True).debug("/auth: {}", lambda: r.text[:200])
     return 200 <= r.status_code < 300
 
-def wait_user_ready(session, bearer, attempts=10, delay=1.5):
+def wait_user_ready(session, bearer, attempts=10, delay=0.5):
     headers = {"Authorization": f"Bearer {bearer}",
                "Origin": "https://linea.build",
                "Referer": "https://linea.build/"}
-    for _ in range(attempts):
+    for attempt in range(attempts):
+        if attempt:
+            count_retry("users/me")
         r = session.get(USERS_ME_URL, headers=headers, timeout=10)
-        logger.info(f"/users/me: {r.status_code} {r.text[:160]}")
+        logger.opt(lazy=True).debug("/users/me: {} {}", lambda: r.status_code, lambda: r.text[:160])
         if r.status_code == 200:
             return True
-        time.sleep(delay)
+        time.sleep(backoff_delay(attempt + 1, delay, 5))
     return False
 
 def read_spins_today(session, bearer):
@@ -180,23 +1003,30 @@ def read_spins_today(session, bearer):
         js = r.json()
     except Exception:
         js = {}
-    logger.info(f"/spins/today: {r.status_code} {str(js)[:200]}")
+    logger.opt(lazy=True).debug("/spins/today: {} {}", lambda: r.status_code, lambda: str(js)[:200])
     return r.status_code, js
 
-def wait_counters_update(session, bearer, timeout_sec=180, interval_sec=6):
-    status0, js0 = read_spins_today(session, bearer)
+def counters_changed(js0, js):
     plays0, today0 = js0.get("plays"), js0.get("todaySpins")
-    t0 = time.time()
-    last = js0
-    while time.time() - t0 < timeout_sec:
-        time.sleep(interval_sec)
-        _, js = read_spins_today(session, bearer)
-        last = js
-        plays, today = js.get("plays"), js.get("todaySpins")
-        if (isinstance(plays0, int) and isinstance(plays, int) and plays > plays0) or \
-           (isinstance(today0, int) and isinstance(today, int) and today < today0):
-            logger.success(f"Счётчики обновились: plays {plays0}->{plays}, todaySpins {today0}->{today}")
-            return True, js0, js
+    plays, today = js.get("plays"), js.get("todaySpins")
+    return (isinstance(plays0, int) and isinstance(plays, int) and plays > plays0) or \
+           (isinstance(today0, int) and isinstance(today, int) and today < today0)
+
+@timed("spin.counters")
+def wait_counters_update(session, bearer, timeout_sec=180, tracker=None, js0=None):
+    """Ждёт, пока хаб проиндексирует спин. js0 — счётчики, снятые до отправки tx;
+    без них читаем сейчас (индексатор мог уже успеть — тогда ждём до таймаута)."""
+    if js0 is None:
+        _, js0 = read_spins_today(session, bearer)
+    if not any(isinstance(js0.get(k), int) for k in ("plays", "todaySpins")):
+        logger.warning("Счётчики не прочитались — изменения не отследить, не ждём.")
+        return False, js0, js0
+    tracker = tracker or get_tracker()
+    ok, last = tracker.wait_counters(session, bearer, js0, timeout_sec=timeout_sec)
+    if ok:
+        logger.success(f"Счётчики обновились: plays {js0.get('plays')}->{last.get('plays')}, "
+                       f"todaySpins {js0.get('todaySpins')}->{last.get('todaySpins')}")
+        return True, js0, last
     logger.warning("Счётчики не обновились за отведённое время.")
     return False, js0, last
 
@@ -223,11 +1053,11 @@ def get_spin_signature(session, bearer):
                "Origin": "https://linea.build",
                "Referer": "https://linea.build/"}
     r = session.post(SPINS_URL, headers=headers, timeout=15)
-    text = r.text[:200]
-    logger.info(f"/spins: {r.status_code} {text}")
+    logger.info("/spins: {}", r.status_code)
+    logger.opt(lazy=True).debug("/spins: {}", lambda: r.text[:200])
     if r.status_code == 403 and "exhausted your spins" in r.text:
         return {"status": "no_spins"}
-    if r.status_code == 404 and ("not found" in r.text.lower() or "not found" in text.lower()):
+    if r.status_code == 404 and "not found" in r.text.lower():
         return {"status": "not_activated"}
     r.raise_for_status()
     return {"status": "ok", "data": r.json()}
@@ -243,6 +1073,7 @@ def maybe_activate_and_retry(session, tokens):
     logger.success("Кошелёк активирован автоматически.")
     return True
 
+@timed("streak")
 def get_streak(session, bearer):
     r = session.get(USERS_ME_URL, headers={"Authorization": f"Bearer {bearer}",
                                            "Origin": "https://linea.build",
@@ -262,6 +1093,331 @@ def check_extra_spin_available(session, bearer):
         return True
     return False
 
+# ===== JSON-RPC batch и общий трекер =====
+def rpc_batch(session, calls, url=None, timeout=20):
+    """Отправляет список (method, params) одним JSON-RPC batch-запросом.
+
+    Возвращает список result в том же порядке; на месте ошибок — None.
+    """
+    if not calls:
+        return []
+    payload = [{"jsonrpc": "2.0", "id": i, "method": m, "params": list(p)}
+               for i, (m, p) in enumerate(calls)]
+    r = session.post(url or LINEA_RPC, json=payload, timeout=timeout)
+    r.raise_for_status()
+    js = r.json()
+    if isinstance(js, dict):
+        js = [js]
+    out = [None] * len(calls)
+    for item in js:
+        i = item.get("id")
+        if isinstance(i, int) and 0 <= i < len(out):
+            if "error" in item:
+                logger.warning(f"RPC {calls[i][0]}: {item['error']}")
+            out[i] = item.get("result")
+    return out
+
+class TxTracker:
+    """Общий трекер для всех кошельков в полёте.
+
+    Квитанции: один поток на каждый новый блок одним batch-запросом спрашивает
+    receipts всех ожидающих participate-транзакций и будит ждущие кошельки.
+    Счётчики: второй поток раз в COUNTERS_POLL_INTERVAL опрашивает /spins/today
+    не больше чем у COUNTERS_POLL_BUDGET кошельков (давно не проверенные — первыми),
+    так что число запросов не растёт вместе с числом кошельков.
+    """
+
+    def __init__(self, proxy=None, rpc_url=None, block_interval=None,
+                 counters_interval=None, counters_budget=None):
+        chain_stack()
+        self.rpc_url = rpc_url or LINEA_RPC
+        self.proxy = proxy
+        self.session = make_session(proxy)
+        self.block_interval = block_interval or RECEIPT_POLL_INTERVAL
+        self.counters_interval = counters_interval or COUNTERS_POLL_INTERVAL
+        self.counters_budget = counters_budget or COUNTERS_POLL_BUDGET
+        self._lock = threading.Lock()
+        self._receipts = {}   # tx_hash -> {"event", "receipt"}
+        self._counters = []   # список ожидающих обновления счётчиков
+        self._last_block = None
+        self._threads = []
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._threads:
+                return
+            for target, name in ((self._receipt_loop, "tx-tracker"),
+                                 (self._counters_loop, "counters-tracker")):
+                t = threading.Thread(target=target, name=name, daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _rpc_session(self):
+        """Сессия для опроса RPC: свой прокси, а если пул пометил его мёртвым — следующий живой."""
+        pool = _proxy_pool
+        if pool is None or not pool.proxies:
+            return self.session
+        start = pool.proxies.index(self.proxy) if self.proxy in pool.proxies else 0
+        try:
+            proxy = pool.acquire(start)
+        except LookupError:
+            return self.session  # живых нет — пробуем старый, пул перепроверит их по TTL
+        if proxy != self.proxy:
+            logger.warning(f"Трекер: прокси {self.proxy} недоступен — переходим на {proxy}")
+            self.proxy, self.session = proxy, make_session(proxy)
+        return self.session
+
+    # --- квитанции ---
+    def wait_receipt(self, tx_hash, timeout=180):
+        tx_hash = tx_hash.hex() if hasattr(tx_hash, "hex") else str(tx_hash)
+        if not tx_hash.startswith("0x"):
+            tx_hash = "0x" + tx_hash
+        waiter = {"event": threading.Event(), "receipt": None}
+        with self._lock:
+            waiter = self._receipts.setdefault(tx_hash, waiter)
+        self._ensure_started()
+        try:
+            if not waiter["event"].wait(timeout):
+                raise TimeExhausted(f"Transaction {tx_hash} is not in the chain after {timeout} seconds")
+            return waiter["receipt"]
+        finally:
+            with self._lock:
+                self._receipts.pop(tx_hash, None)
+
+    def _poll_receipts(self):
+        with self._lock:
+            pending = [h for h, w in self._receipts.items() if not w["event"].is_set()]
+        if not pending:
+            return
+        session = self._rpc_session()
+        block = rpc_batch(session, [("eth_blockNumber", [])], url=self.rpc_url)[0]
+        if block is None or block == self._last_block:
+            return
+        self._last_block = block
+        found = rpc_batch(session, [("eth_getTransactionReceipt", [h]) for h in pending],
+                          url=self.rpc_url)
+        for tx_hash, raw in zip(pending, found):
+            if not raw:
+                continue
+            with self._lock:
+                waiter = self._receipts.get(tx_hash)
+            if waiter:
+                waiter["receipt"] = AttributeDict.recursive(receipt_formatter(raw))
+                waiter["event"].set()
+
+    def _receipt_loop(self):
+        while True:
+            try:
+                self._poll_receipts()
+            except Exception as e:
+                logger.warning(f"Трекер квитанций: {e}")
+            time.sleep(self.block_interval)
+
+    # --- счётчики /spins/today ---
+    def wait_counters(self, session, bearer, js0, timeout_sec=180):
+        waiter = {"event": threading.Event(), "session": session, "bearer": bearer,
+                  "base": js0, "last": js0, "checked": time.time()}
+        with self._lock:
+            self._counters.append(waiter)
+        self._ensure_started()
+        try:
+            ok = waiter["event"].wait(timeout_sec)
+            return ok, waiter["last"]
+        finally:
+            with self._lock:
+                if waiter in self._counters:
+                    self._counters.remove(waiter)
+
+    def _poll_counters(self):
+        with self._lock:
+            due = sorted((w for w in self._counters if not w["event"].is_set()),
+                         key=lambda w: w["checked"])[:self.counters_budget]
+        for waiter in due:
+            try:
+                _, js = read_spins_today(waiter["session"], waiter["bearer"])
+            except Exception as e:
+                logger.warning(f"Трекер счётчиков: {e}")
+                continue
+            waiter["checked"] = time.time()
+            waiter["last"] = js
+            if counters_changed(waiter["base"], js):
+                waiter["event"].set()
+
+    def _counters_loop(self):
+        while True:
+            time.sleep(self.counters_interval)
+            try:
+                self._poll_counters()
+            except Exception as e:
+                logger.warning(f"Трекер счётчиков: {e}")
+
+_tracker = None
+_singleton_lock = threading.Lock()
+
+def get_tracker(proxy=None):
+    """Общий на процесс TxTracker; создаётся при первом обращении (с прокси первого кошелька,
+    дальше на каждом опросе берёт у пула живой)."""
+    global _tracker
+    with _singleton_lock:
+        if _tracker is None:
+            _tracker = TxTracker(proxy=proxy)
+        return _tracker
+
+# ===== Кэш данных сети =====
+class ChainContext:
+    """Данные сети, общие для всех кошельков прогона.
+
+    Контракт и ABI-кодер собираются один раз, gasPrice живёт GAS_PRICE_TTL,
+    газ participate оценивается один раз и переоценивается, только если
+    транзакция откатилась или потратила больше выученного значения.
+    """
+
+    def __init__(self):
+        chain_stack()
+        self.contract = Web3().eth.contract(address=CONTRACT_ADDRESS, abi=CONTRACT_ABI + CONTRACT_EVENTS_ABI)
+        self._lock = threading.Lock()
+        self._chain_id = None
+        self._gas_price = None
+        self._gas_price_at = 0.0
+        self._gas = None
+
+    def encode_participate(self, args):
+        return self.contract.encodeABI(fn_name="participate", args=list(args))
+
+    def chain_id(self, w3):
+        if self._chain_id is None:
+            self._chain_id = w3.eth.chain_id
+        return self._chain_id
+
+    def gas_price(self, w3):
+        with self._lock:
+            if self._gas_price is not None and time.time() - self._gas_price_at < GAS_PRICE_TTL:
+                return self._gas_price
+        price = w3.eth.gas_price
+        with self._lock:
+            self._gas_price, self._gas_price_at = price, time.time()
+        return price
+
+    def participate_gas(self, w3, address, args):
+        """Выученный газ participate или свежая оценка estimate_gas."""
+        with self._lock:
+            if self._gas is not None:
+                return self._gas
+        try:
+            gas = w3.eth.estimate_gas({"from": address, "to": CONTRACT_ADDRESS,
+                                       "data": self.encode_participate(args)})
+        except Exception as e:
+            logger.error(f"({address}) Не удалось оценить газ: {e} — использую дефолт.")
+            return GAS_DEFAULT
+        with self._lock:
+            self._gas = gas
+        return gas
+
+    def observe_receipt(self, receipt):
+        """Сбрасывает выученный газ, если tx откатилась или съела больше ожидаемого."""
+        with self._lock:
+            if self._gas is not None and (receipt.status != 1 or receipt.gasUsed > self._gas):
+                logger.info(f"Газ participate: выучено {self._gas}, потрачено {receipt.gasUsed} — переоценим")
+                self._gas = None
+
+    def decode_events(self, receipt):
+        """События контракта из логов квитанции (по CONTRACT_EVENTS_ABI): ["Имя(k=v, ...)", ...]."""
+        logs = [x for x in receipt.get("logs", []) if x.get("address") == CONTRACT_ADDRESS]
+        if not logs:
+            return []
+        own = AttributeDict({**receipt, "logs": logs})
+        out = []
+        for event in self.contract.events:
+            for ev in event().process_receipt(own, errors=DISCARD):
+                out.append(f"{ev['event']}({', '.join(f'{k}={v}' for k, v in ev['args'].items())})")
+        return out
+
+    def build_participate_tx(self, w3, address, args, gas, gas_price, nonce):
+        return {"from": address, "to": CONTRACT_ADDRESS, "value": 0,
+                "data": self.encode_participate(args), "gas": gas,
+                "gasPrice": gas_price, "nonce": nonce, "chainId": self.chain_id(w3)}
+
+class NonceManager:
+    """Nonce и балансы адресов, загруженные одним batch-запросом на старте.
+
+    После каждой отправки nonce ведётся локально, а баланс уменьшается на
+    фактически потраченный газ — на спин больше не нужны get_balance и
+    get_transaction_count. Неизвестный адрес или ошибка nonce — откат к RPC.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._nonces = {}
+        self._balances = {}
+
+    def prefetch(self, session, addresses, batch_size=RPC_BATCH_SIZE):
+        addresses = list(dict.fromkeys(addresses))
+        for i in range(0, len(addresses), batch_size):
+            chunk = addresses[i:i + batch_size]
+            calls = []
+            for a in chunk:
+                calls.append(("eth_getTransactionCount", [a, "pending"]))
+                calls.append(("eth_getBalance", [a, "latest"]))
+            try:
+                res = rpc_batch(session, calls)
+            except Exception as e:
+                logger.warning(f"Предзагрузка nonce/балансов не удалась: {e}")
+                return
+            with self._lock:
+                for j, a in enumerate(chunk):
+                    nonce, balance = res[2 * j], res[2 * j + 1]
+                    if nonce is not None:
+                        self._nonces[a.lower()] = int(nonce, 16)
+                    if balance is not None:
+                        self._balances[a.lower()] = int(balance, 16)
+        logger.info(f"Nonce/балансы загружены для {len(self._nonces)} адресов")
+
+    def nonce(self, w3, address):
+        with self._lock:
+            n = self._nonces.get(address.lower())
+        return n if n is not None else w3.eth.get_transaction_count(address, "pending")
+
+    def balance(self, w3, address):
+        with self._lock:
+            b = self._balances.get(address.lower())
+        return b if b is not None else w3.eth.get_balance(address)
+
+    def known_balance(self, address):
+        with self._lock:
+            return self._balances.get(address.lower())
+
+    def sent(self, address, nonce):
+        with self._lock:
+            self._nonces[address.lower()] = nonce + 1
+
+    def spent(self, address, wei):
+        with self._lock:
+            if address.lower() in self._balances:
+                self._balances[address.lower()] -= wei
+
+    def forget(self, address):
+        with self._lock:
+            self._nonces.pop(address.lower(), None)
+            self._balances.pop(address.lower(), None)
+
+_nonce_manager = None
+
+def get_nonce_manager():
+    global _nonce_manager
+    with _singleton_lock:
+        if _nonce_manager is None:
+            _nonce_manager = NonceManager()
+        return _nonce_manager
+
+_chain_context = None
+
+def get_chain_context():
+    global _chain_context
+    with _singleton_lock:
+        if _chain_context is None:
+            _chain_context = ChainContext()
+        return _chain_context
+
 # ===== Работа с призами (факт) =====
 def prize_to_str(p):
     if not isinstance(p, dict):
@@ -285,48 +1441,287 @@ def fetch_prizes_page(session, bearer, skip=0, take=30):
         js = r.json()
     except Exception:
         js = {}
-    logger.info(f"/prizes/user: {r.status_code} (skip={skip}, take={take}) size={len(js.get('data', []) or [])}, total={js.get('total')}")
+    logger.opt(lazy=True).debug("/prizes/user: {} (skip={}, take={}) size={}, total={}",
+                                lambda: r.status_code, lambda: skip, lambda: take,
+                                lambda: len(js.get("data", []) or []), lambda: js.get("total"))
     if r.status_code != 200:
         return {"data": [], "total": 0, "skip": skip, "take": take}
     return js
 
-def fetch_all_prizes(session, bearer, page_size=50, max_pages=20):
-    all_items = []
-    skip = 0
-    for _ in range(max_pages):
-        page = fetch_prizes_page(session, bearer, skip=skip, take=page_size)
-        items = page.get("data") or []
-        all_items.extend(items)
-        total = int(page.get("total") or 0)
-        skip += page_size
-        if len(all_items) >= total or not items:
-            return all_items, total
-    return all_items, len(all_items)
+def prize_key(p):
+    pid = p.get("id") or p.get("_id") or p.get("uuid")
+    return f"id:{pid}" if pid else f"txt:{prize_to_str(p)}"
 
 def prizes_set_signature(prizes):
-    s = set()
-    for p in prizes or []:
-        pid = p.get("id") or p.get("_id") or p.get("uuid")
-        if pid:
-            s.add(("id", str(pid)))
-        else:
-            s.add(("txt", prize_to_str(p)))
-    return s
-
-def diff_new_prizes(before_list, after_list):
-    before = prizes_set_signature(before_list)
-    new_items = []
-    for p in after_list or []:
-        pid = p.get("id") or p.get("_id") or p.get("uuid")
-        key = ("id", str(pid)) if pid else ("txt", prize_to_str(p))
-        if key not in before:
-            new_items.append(p)
-    return new_items
+    return {prize_key(p) for p in prizes or []}
+
+def diff_new_prizes(before, after_list):
+    """Призы из after_list, которых нет в before (готовый индекс ключей или список призов)."""
+    known = before if isinstance(before, (set, frozenset)) else prizes_set_signature(before)
+    return [p for p in after_list or [] if prize_key(p) not in known]
+
+class PrizeStore:
+    """Локальная (SQLite) история призов по адресам + индекс ключей в памяти
+    (пока кошелёк в работе — после выдачи результата release_wallet его выгружает).
+
+    sync() листает /prizes/user с начала (новые сверху) и останавливается на
+    странице с уже известным призом, так что после первой полной загрузки
+    каждый вызов обычно стоит один запрос.
+    """
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or PRIZE_DB_FILE, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS prizes (
+                                  address  TEXT NOT NULL,
+                                  pkey     TEXT NOT NULL,
+                                  data     TEXT NOT NULL,
+                                  added_at REAL NOT NULL,
+                                  PRIMARY KEY (address, pkey))""")
+        self._conn.commit()
+        self._index = {}
+
+    def known(self, address):
+        address = address.lower()
+        with self._lock:
+            if address not in self._index:
+                rows = self._conn.execute("SELECT pkey FROM prizes WHERE address = ?", (address,))
+                self._index[address] = {k for (k,) in rows}
+            return self._index[address]
+
+    def add(self, address, prizes):
+        address = address.lower()
+        known = self.known(address)
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO prizes (address, pkey, data, added_at) VALUES (?, ?, ?, ?)",
+                [(address, prize_key(p), json.dumps(p, ensure_ascii=False), now) for p in prizes])
+            self._conn.commit()
+            known.update(prize_key(p) for p in prizes)
+
+    def forget(self, address):
+        with self._lock:
+            self._index.pop(address.lower(), None)
+
+    @timed("prizes")
+    def sync(self, session, bearer, address, page_size=50, max_pages=20):
+        """Догружает новые призы адреса. Возвращает (new_prizes, total)."""
+        known = self.known(address)
+        new_items, seen, total = [], set(), 0
+        skip = 0
+        for _ in range(max_pages):
+            page = fetch_prizes_page(session, bearer, skip=skip, take=page_size)
+            items = page.get("data") or []
+            total = int(page.get("total") or 0)
+            fresh = [p for p in diff_new_prizes(known, items) if prize_key(p) not in seen]
+            seen.update(prize_key(p) for p in fresh)
+            new_items.extend(fresh)
+            skip += page_size
+            hit_known = len(fresh) < len(items)
+            if not items or skip >= total or (hit_known and len(known) + len(new_items) >= total):
+                break
+        if new_items:
+            self.add(address, new_items)
+        return new_items, total
+
+_prize_store = None
+
+def get_prize_store():
+    global _prize_store
+    with _singleton_lock:
+        if _prize_store is None:
+            _prize_store = PrizeStore()
+        return _prize_store
+
+# ===== Журнал прогона =====
+def utc_day():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+class RunJournal:
+    """Append-only JSONL-журнал переходов кошельков за текущие UTC-сутки.
+
+    Фазы: tx_sent (tx_hash, пишется до отправки) -> receipt -> prizes -> ... -> done (итоговая строка);
+    tx_dropped — tx не ушла в сеть или так и не попала в блок; tx_failed — tx откатилась.
+    Каждая запись сразу fsync-ится, поэтому после падения перезапуск знает,
+    какие кошельки уже готовы и у каких висит отправленная транзакция.
+    Записи прошлых суток отбрасываются при открытии.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or JOURNAL_FILE
+        self.day = utc_day()
+        self._lock = threading.Lock()
+        self._state = {}
+        with file_lock(self.path):
+            kept = []
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            ev = json.loads(line)
+                        except ValueError:
+                            continue  # недописанная строка при падении
+                        if ev.get("day") == self.day:
+                            kept.append(line if line.endswith("\n") else line + "\n")
+                            self._apply(ev)
+            except OSError:
+                return
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(kept)
+            os.replace(tmp, self.path)
+        if self._state:
+            logger.info(f"Журнал {self.path}: {len(self._state)} кошельков уже в работе сегодня")
+
+    def _apply(self, ev):
+        st = self._state.setdefault(ev["address"].lower(), {"prizes": []})
+        st["phase"] = ev["phase"]
+        if ev["phase"] == "tx_sent":
+            st["tx_hash"] = ev.get("tx_hash")
+            st["tx_ts"] = ev.get("ts")
+        elif ev["phase"] == "receipt":
+            st.setdefault("txs", {})[ev.get("tx_hash")] = {
+                "status": ev.get("status"), "gas_used": ev.get("gas_used"),
+                "gas_price": ev.get("gas_price"), "prizes": []}
+        elif ev["phase"] == "prizes":
+            st["prizes"].extend(ev.get("prizes") or [])
+            st["spun"] = True
+            tx = (st.get("txs") or {}).get(ev.get("tx_hash"))
+            if tx is not None:
+                tx["prizes"] = ev.get("prizes") or []
+        elif ev["phase"] == "done":
+            st["result"] = ev.get("result")
+
+    def record(self, address, phase, **data):
+        ev = {"ts": round(time.time(), 3), "day": self.day, "address": address.lower(),
+              "phase": phase, **data}
+        line = json.dumps(ev, ensure_ascii=False) + "\n"
+        with self._lock, file_lock(self.path):
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(ev)
+
+    def state(self, address):
+        with self._lock:
+            return dict(self._state.get(address.lower()) or {"prizes": []})
+
+    def forget(self, address):
+        """Выгружает состояние адреса из памяти (файл не трогает)."""
+        with self._lock:
+            self._state.pop(address.lower(), None)
+
+_journal = None
+
+def get_journal():
+    global _journal
+    with _singleton_lock:
+        if _journal is None or _journal.day != utc_day():
+            _journal = RunJournal()
+        return _journal
+
+def journal_txs(address):
+    """Транзакции адреса за сегодня из журнала: [{tx_hash, status, gas_used, gas_price, prizes}]."""
+    txs = get_journal().state(address).get("txs") or {}
+    return [{"tx_hash": h, **t} for h, t in txs.items()]
+
+# ===== История прогонов =====
+class HistoryStore:
+    """Локальная (SQLite) история: строка на кошелёк за каждый прогон и строка на транзакцию.
+
+    Ничего не перезаписывается между запусками; --report считает агрегаты прямо в SQLite,
+    без сетевых запросов.
+    """
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or HISTORY_DB_FILE, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at  REAL NOT NULL,
+                finished_at REAL,
+                wallets     INTEGER,
+                elapsed_sec REAL);
+            CREATE TABLE IF NOT EXISTS wallet_runs (
+                run_id    INTEGER NOT NULL,
+                day       TEXT NOT NULL,
+                address   TEXT NOT NULL,
+                status    TEXT NOT NULL,
+                streak    INTEGER,
+                reward    TEXT,
+                total_sec REAL,
+                PRIMARY KEY (run_id, address));
+            CREATE INDEX IF NOT EXISTS wallet_runs_address_day ON wallet_runs (address, day);
+            CREATE INDEX IF NOT EXISTS wallet_runs_day ON wallet_runs (day);
+            CREATE TABLE IF NOT EXISTS txs (
+                tx_hash   TEXT PRIMARY KEY,
+                day       TEXT NOT NULL,
+                address   TEXT NOT NULL,
+                status    INTEGER,
+                gas_used  INTEGER,
+                gas_price INTEGER,
+                prizes    TEXT NOT NULL,
+                n_prizes  INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS txs_day ON txs (day);""")
+        self._conn.commit()
+
+    def start_run(self):
+        with self._lock:
+            cur = self._conn.execute("INSERT INTO runs (started_at) VALUES (?)", (time.time(),))
+            self._conn.commit()
+            return cur.lastrowid
+
+    def add(self, run_id, res):
+        """Строка кошелька за прогон + его транзакции (повторно встреченная tx только дополняет призы)."""
+        if res.address == "-":
+            return
+        day, address = utc_day(), res.address.lower()
+        total_sec = res.metrics["total_sec"] if res.metrics else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO wallet_runs (run_id, day, address, status, streak, reward, total_sec) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (run_id, day, address, res.status, res.streak, res.reward, total_sec))
+            self._conn.executemany(
+                "INSERT INTO txs (tx_hash, day, address, status, gas_used, gas_price, prizes, n_prizes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(tx_hash) DO UPDATE SET prizes = excluded.prizes, n_prizes = excluded.n_prizes "
+                "WHERE excluded.n_prizes > txs.n_prizes",
+                [(t["tx_hash"], day, address, t.get("status"), t.get("gas_used"), t.get("gas_price"),
+                  json.dumps(t.get("prizes") or [], ensure_ascii=False), len(t.get("prizes") or []))
+                 for t in res.txs or []])
+            self._conn.commit()
+
+    def finish_run(self, run_id, wallets, elapsed):
+        with self._lock:
+            self._conn.execute("UPDATE runs SET finished_at = ?, wallets = ?, elapsed_sec = ? WHERE run_id = ?",
+                               (time.time(), wallets, round(elapsed, 3), run_id))
+            self._conn.commit()
+
+    def query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+_history_store = None
+
+def get_history_store():
+    global _history_store
+    with _singleton_lock:
+        if _history_store is None:
+            _history_store = HistoryStore()
+        return _history_store
 
 # ===== Основной спин =====
-def perform_spin(w3, session, bearer, address, pk, prizes_before):
-    """Возвращает (status, extra_info, reward_list[str])."""
-    sig_resp = get_spin_signature(session, bearer)
+def perform_spin(w3, session, bearer, address, pk, prize_store, tracker=None, defer=False):
+    """Возвращает (status, extra_info, reward_list[str]); defer — см. finish_spin."""
+    tracker = tracker or get_tracker()
+    with phase("spin.signature"):
+        sig_resp = get_spin_signature(session, bearer)
     status = sig_resp["status"]
 
     if status == "no_spins":
@@ -335,8 +1730,11 @@ def perform_spin(w3, session, bearer, address, pk, prizes_before):
 
     if status == "not_activated":
         logger.warning(f"({address}) Пользователь не активирован — пробуем автоактивацию.")
-        if maybe_activate_and_retry(session, {"jwt": bearer}):
-            sig_resp = get_spin_signature(session, bearer)
+        with phase("spin.activate"):
+            activated = maybe_activate_and_retry(session, {"jwt": bearer})
+        if activated:
+            with phase("spin.signature"):
+                sig_resp = get_spin_signature(session, bearer)
             status = sig_resp["status"]
             if status == "not_activated":
                 logger.error(f"({address}) Не удалось активировать кошелёк — пропуск.")
@@ -353,7 +1751,7 @@ def perform_spin(w3, session, bearer, address, pk, prizes_before):
         return "error", None, []
 
     spin_data = sig_resp["data"]
-    logger.info(f"({address}) Данные спина: {spin_data}")
+    logger.opt(lazy=True).debug("({}) Данные спина: {}", lambda: address, lambda: spin_data)
 
     try:
         nonce   = int(spin_data["nonce"])
@@ -364,19 +1762,17 @@ def perform_spin(w3, session, bearer, address, pk, prizes_before):
         logger.error(f"({address}) Ошибка разбора сигнатуры: {e}")
         return "error", None, []
 
-    contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=CONTRACT_ABI)
-    gas_price = w3.eth.gas_price
-
-    try:
-        est_gas = contract.functions.participate(nonce, exp_ts, boost, (r_, s_, v_)) \
-            .estimate_gas({"from": address})
-        logger.info(f"({address}) Оценка газа: {est_gas}, gasPrice: {gas_price}")
-    except Exception as e:
-        logger.error(f"({address}) Не удалось оценить газ: {e} — использую дефолт.")
-        est_gas = 250_000
+    chain = get_chain_context()
+    args = (nonce, exp_ts, boost, (r_, s_, v_))
+    with phase("spin.gas"):
+        gas_price = chain.gas_price(w3)
+        est_gas = chain.participate_gas(w3, address, args)
+    logger.info(f"({address}) Оценка газа: {est_gas}, gasPrice: {gas_price}")
 
+    accounts = get_nonce_manager()
     need_wei = int(est_gas * gas_price * 1.15)
-    balance  = w3.eth.get_balance(address)
+    with phase("spin.balance"):
+        balance = accounts.balance(w3, address)
     if balance < need_wei:
         logger.warning(
             f"({address}) Недостаточно средств: {Web3.from_wei(balance,'ether')} ETH, "
@@ -384,84 +1780,209 @@ def perform_spin(w3, session, bearer, address, pk, prizes_before):
         )
         return "error", "Недостаточно средств", []
 
-    nonce_on_chain = w3.eth.get_transaction_count(address)
-    tx = contract.functions.participate(nonce, exp_ts, boost, (r_, s_, v_)).build_transaction({
-        "from": address,
-        "gas": int(est_gas * 1.10),
-        "gasPrice": gas_price,
-        "nonce": nonce_on_chain,
-    })
-
-    signed = w3.eth.account.sign_transaction(tx, pk)
-    tx_hash = w3.eth.send_raw_transaction(signed.rawTransaction)
-    tx_hash_hex = tx_hash.hex()
+    # счётчики «до» — снимаем до отправки, иначе быстрый индексатор обгонит нас;
+    # без них изменения не заметить — тогда призы сверяем без ожидания индексатора
+    status0, counters0 = read_spins_today(session, bearer)
+    if status0 != 200:
+        logger.warning(f"({address}) Счётчики до спина не получены ({status0}) — ждать индексатор не будем.")
+        counters0 = None
+
+    with phase("spin.send"):
+        nonce_on_chain = accounts.nonce(w3, address)
+        tx = chain.build_participate_tx(w3, address, args, gas=int(est_gas * 1.10),
+                                        gas_price=gas_price, nonce=nonce_on_chain)
+
+        signed = Account.sign_transaction(tx, pk)
+        tx_hash_hex = signed.hash.hex()
+        # хэш известен до отправки: пишем его первым, чтобы падение посреди send не потеряло tx
+        journal = get_journal()
+        journal.record(address, "tx_sent", tx_hash=tx_hash_hex, nonce=nonce_on_chain)
+        try:
+            w3.eth.send_raw_transaction(signed.rawTransaction)
+        except Exception:
+            journal.record(address, "tx_dropped", tx_hash=tx_hash_hex)
+            accounts.forget(address)  # локальный nonce/баланс мог разойтись с сетью
+            raise
+        accounts.sent(address, nonce_on_chain)
     logger.info(f"({address}) Tx отправлен: {tx_hash_hex}")
 
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
+    return finish_spin(session, bearer, address, tx_hash_hex, prize_store, tracker,
+                       wait_counters=counters0 is not None, counters0=counters0, defer=defer)
+
+def finish_spin(session, bearer, address, tx_hash_hex, prize_store, tracker=None, wait_counters=True,
+                counters0=None, defer=False):
+    """Квитанция, счётчики и новые призы для уже отправленной participate-транзакции.
+
+    defer=True: сразу после квитанции возвращает ("deferred", {tx_hash, counters0}, события из логов),
+    сверку с хабом потом делает confirm_spin.
+    """
+    tracker = tracker or get_tracker()
+    journal = get_journal()
+    with phase("spin.receipt"):
+        receipt = tracker.wait_receipt(tx_hash_hex, timeout=180)
+    get_chain_context().observe_receipt(receipt)
+    get_nonce_manager().spent(address, receipt.gasUsed * receipt.get("effectiveGasPrice", 0))
+    journal.record(address, "receipt", tx_hash=tx_hash_hex, status=receipt.status, gas_used=receipt.gasUsed,
+                   gas_price=receipt.get("effectiveGasPrice"))
     if receipt.status != 1:
         logger.error(f"({address}) Транзакция не прошла: {tx_hash_hex}")
+        journal.record(address, "tx_failed", tx_hash=tx_hash_hex)  # следующая попытка — с новой подписью
         return "error", "tx failed", []
 
     logger.success(f"({address}) Успешно! Tx: {tx_hash_hex} | Gas used: {receipt.gasUsed}")
+    if defer:
+        events = get_chain_context().decode_events(receipt)
+        if events:
+            logger.success(f"({address}) События tx: {', '.join(events)}")
+        return "deferred", {"tx_hash": tx_hash_hex, "counters0": counters0}, events
+    return confirm_spin(session, bearer, address, tx_hash_hex, prize_store, tracker, wait_counters, counters0)
+
+def confirm_spin(session, bearer, address, tx_hash_hex, prize_store, tracker=None, wait_counters=True,
+                 counters0=None):
+    """Сверка успешного спина с хабом: ждём индексатор и забираем новые призы."""
+    tracker = tracker or get_tracker()
+    if wait_counters:
+        ok, before, after = wait_counters_update(session, bearer, timeout_sec=180, tracker=tracker,
+                                                 js0=counters0)
+        if ok:
+            logger.info(f"({address}) Счётчики обновились: {before} -> {after}")
+        else:
+            logger.warning(f"({address}) Индексация запаздывает (но транза успешна).")
 
-    ok, before, after = wait_counters_update(session, bearer, timeout_sec=180, interval_sec=6)
-    if ok:
-        logger.info(f"({address}) Счётчики обновились: {before} -> {after}")
-    else:
-        logger.warning(f"({address}) Индексация запаздывает (но транза успешна).")
-
-    prizes_after, total_after = fetch_all_prizes(session, bearer, page_size=50)
-    new_prizes = diff_new_prizes(prizes_before, prizes_after)
+    new_prizes, total_after = prize_store.sync(session, bearer, address, page_size=50)
     if new_prizes:
         display = [prize_to_str(p) for p in new_prizes]
         logger.success(f"({address}) Новые призы: {', '.join(display)}")
     else:
         logger.info(f"({address}) Новых призов не появилось (total={total_after}).")
 
-    return "done", None, [prize_to_str(p) for p in new_prizes]
+    won = [prize_to_str(p) for p in new_prizes]
+    get_journal().record(address, "prizes", tx_hash=tx_hash_hex, prizes=won)
+    return "done", None, won
+
+def confirm_deferred(result, session, bearer, prize_store, tracker, info, won_before, events, w3, pk):
+    """Фоновая сверка спина в режиме deferred: призы, дополнительные спины, streak и «done» в журнал.
+
+    Дополнительные спины крутятся здесь же, в пуле сверки (уже без отсрочки), — как в inline.
+    """
+    address = result.address
+    _, _, won = confirm_spin(session, bearer, address, info["tx_hash"], prize_store, tracker,
+                             wait_counters=info["counters0"] is not None, counters0=info["counters0"])
+    prizes = won_before + [x for x in won if x]
+    while check_extra_spin_available(session, bearer):
+        logger.info(f"({address}) Доступен ещё спин — крутим в фоне.")
+        status, _, new_list = perform_spin(w3, session, bearer, address, pk, prize_store, tracker)
+        if status != "done":
+            break
+        prizes.extend(x for x in new_list if x)
+    result.reward = ", ".join(prizes or events) or "Без приза"
+    result.streak = get_streak(session, bearer)
+    get_journal().record(address, "done", result=result.as_row())
+    return result
 
 def spin_wallet(pk, proxy, idx, total):
-    session = requests.Session()
-    session.proxies = {"http": f"http://{proxy}", "https": f"http://{proxy}"}
-    session.headers.update({
-        "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                       "AppleWebKit/537.36 (KHTML, like Gecko) "
-                       "Chrome/118.0.0.0 Safari/537.36")
-    })
-
-    if not test_proxy_with_retries(proxy):
-        return {"address": "-", "streak": None, "status": "Прокси ошибка", "reward": "—"}
+    """Полный цикл одного кошелька; proxy уже проверен пулом прокси."""
+    session = make_session(proxy)
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        session.hooks["response"].append(metrics.on_response)
 
     w3 = make_web3(proxy)
-    address = w3.eth.account.from_key(pk).address
+    tracker = get_tracker(proxy)
+    address = address_of(pk)
+    if metrics is not None:
+        metrics.address = address
     logger.info(f"({idx+1}/{total}) Кошелёк: {address} | Прокси: {proxy}")
 
+    journal = get_journal()
+    st = journal.state(address)
+    if st.get("phase") == "done":
+        logger.info(f"({address}) Уже обработан сегодня (журнал) — пропуск.")
+        return WalletResult.from_row(st["result"])
+    # дожидаемся только tx без квитанции или успешную, но ещё не сверенную; откатившуюся — нет
+    pending_tx = None
+    if st.get("phase") == "tx_sent" or (
+            st.get("phase") == "receipt"
+            and ((st.get("txs") or {}).get(st.get("tx_hash")) or {}).get("status") == 1):
+        pending_tx = st.get("tx_hash")
+
+    # Пустые кошельки отсеиваем до авторизации (баланс из предзагрузки)
+    balance = get_nonce_manager().known_balance(address)
+    if balance is not None:
+        min_wei = int(GAS_PRECHECK * get_chain_context().gas_price(w3) * 1.15)
+        if balance < min_wei:
+            logger.warning(f"({address}) Баланс {Web3.from_wei(balance, 'ether')} ETH — не хватит на газ, пропуск.")
+            return WalletResult(address, status="Недостаточно средств")
+
+    # Быстрый путь: кэшированный токен + /spins/today. Если спинов на сегодня нет —
+    # выходим одним запросом, без handshake, выгрузки призов и streak.
+    tokens = today = None
+    cache_checked = False
+    if not pending_tx:
+        with phase("precheck"):
+            try:
+                tokens, today = cached_session(session, address)
+                cache_checked = True
+            except Exception as e:
+                logger.warning(f"({address}) Быстрая проверка не удалась: {e}")
+    # только явный todaySpins == 0: ответ без поля (или с мусором) не повод закрыть кошелёк на сутки
+    spins_left = today.get("todaySpins") if isinstance(today, dict) else None
+    if type(spins_left) is int and spins_left == 0 and not st.get("spun"):
+        logger.info(f"({address}) Спинов на сегодня нет (plays {today.get('plays')}) — пропуск.")
+        result = WalletResult(address, status="Нет спинов")
+        journal.record(address, "done", result=result.as_row())
+        return result
+
     # Токены
     try:
-        tokens = get_bearer_tokens(session, address, pk)
+        tokens = tokens or get_session_tokens(session, address, pk, use_cache=not cache_checked)
     except Exception as e:
         logger.error(f"({address}) Не удалось получить токены: {e}")
-        return {"address": address, "streak": None, "status": "Токен ошибка", "reward": "—"}
+        return WalletResult(address, status="Токен ошибка", retryable=True)
 
     bearer = tokens.get("jwt") or tokens.get("minifiedJwt")
     if not bearer:
-        return {"address": address, "streak": None, "status": "Нет Bearer", "reward": "—"}
+        return WalletResult(address, status="Нет Bearer", retryable=True)
 
-    # BEFORE: призы до
-    prizes_before, total_before = fetch_all_prizes(session, bearer, page_size=50)
-    logger.info(f"({address}) Призов до спина: {total_before}")
+    # BEFORE: призы до (при незавершённой tx стор уже в состоянии «до» с прошлого запуска)
+    prize_store = get_prize_store()
+    if not pending_tx:
+        _, total_before = prize_store.sync(session, bearer, address, page_size=50)
+        logger.info(f"({address}) Призов до спина: {total_before}")
 
-    any_spin_done = False
-    all_new_prizes = []
+    any_spin_done = bool(st.get("spun"))
+    all_new_prizes = list(st["prizes"])
     last_status = "Ошибка"
+    defer = PRIZE_CONFIRM == "deferred"
 
     while True:
-        status, _, new_list = perform_spin(w3, session, bearer, address, pk, prizes_before)
+        if pending_tx:
+            logger.info(f"({address}) Дожидаемся tx из прошлого запуска: {pending_tx}")
+            # давно отправленная tx уже проиндексирована — ждать счётчики незачем
+            fresh = time.time() - (st.get("tx_ts") or 0) < 180
+            try:
+                status, _, new_list = finish_spin(session, bearer, address, pending_tx, prize_store,
+                                                  tracker, wait_counters=fresh)
+            except TimeExhausted:
+                logger.warning(f"({address}) Tx {pending_tx} так и не попала в блок — запросим новый спин.")
+                journal.record(address, "tx_dropped", tx_hash=pending_tx)
+                status, new_list = "retry", []
+            pending_tx = None
+            if status == "retry":
+                continue
+        else:
+            status, info, new_list = perform_spin(w3, session, bearer, address, pk, prize_store, tracker,
+                                                  defer=defer)
         last_status = status
+        if status == "deferred":
+            # сверка с хабом (счётчики, призы, streak) уходит в фон — кошелёк освобождаем сейчас
+            result = WalletResult(address, None, "Вращено", ", ".join(new_list) or "Ожидает сверки")
+            result.confirm = functools.partial(confirm_deferred, result, session, bearer, prize_store,
+                                               tracker, info, all_new_prizes, new_list, w3, pk)
+            return result
         if status == "done":
             any_spin_done = True
             all_new_prizes.extend([x for x in new_list if x])
-            prizes_before, _ = fetch_all_prizes(session, bearer, page_size=50)
             if check_extra_spin_available(session, bearer):
                 continue
             break
@@ -480,50 +2001,675 @@ def spin_wallet(pk, proxy, idx, total):
                         "not_activated": "Не активирован"}.get(last_status, "Ошибка")
         reward_label = "—"
 
-    return {"address": address, "streak": streak, "status": status_label, "reward": reward_label}
+    result = WalletResult(address, streak, status_label, reward_label)
+    if status_label in ("Вращено", "Нет спинов"):
+        journal.record(address, "done", result=result.as_row())
+    return result
 
-# ======== MAIN ========
-if __name__ == "__main__":
-    logger.add("spin_linea.log", rotation="1 week", backtrace=False, diagnose=False)
+# ===== Движок (asyncio + пул воркеров) =====
+def is_transient_error(e):
+    """Сетевой сбой, таймаут RPC или tx, не попавшая в блок, — повтор может помочь (в отличие от битого ключа)."""
+    return (isinstance(e, (requests.exceptions.RequestException, TimeoutError, ConnectionError))
+            or (TimeExhausted is not None and isinstance(e, TimeExhausted)))
 
-    results = []
-    total = len(private_keys)
-
-    for idx, pk in enumerate(private_keys):
-        proxy = proxies[idx % len(proxies)]
+def run_wallet_safe(pk, proxy_pool, idx, total):
+    metrics = WalletMetrics(idx)
+    token = _current_metrics.set(metrics)
+    try:
         try:
+            with phase("proxy"):
+                proxy = proxy_pool.acquire(idx)
+        except LookupError as e:
+            logger.error(f"(idx={idx}) Прокси: {e}")
+            res = WalletResult(status="Прокси ошибка", retryable=True)
+        else:
             res = spin_wallet(pk, proxy, idx, total)
+    except Exception as e:
+        logger.exception(f"(idx={idx}) Непойманная ошибка: {e}")
+        res = WalletResult(status="Критическая ошибка", retryable=is_transient_error(e))
+    finally:
+        metrics.finish()
+        _current_metrics.reset(token)
+    if res.confirm is not None:
+        res.confirm = functools.partial(run_confirm_safe, res, res.confirm, metrics)
+    else:
+        res.metrics = metrics.as_dict()
+        _attach_txs(res)
+    return res
+
+def release_wallet(address):
+    """Результат кошелька отдан — его индекс призов, nonce/баланс и состояние журнала
+    больше не нужны в памяти (иначе на больших файлах ключей и в --daemon они только копятся)."""
+    if address == "-":
+        return
+    for store in (_prize_store, _nonce_manager, _journal):
+        if store is not None:
+            store.forget(address)
+
+def _attach_txs(res):
+    if res.address != "-":
+        try:
+            res.txs = journal_txs(res.address)
         except Exception as e:
-            logger.exception(f"(idx={idx}) Непойманная ошибка: {e}")
-            res = {"address": "-", "streak": None, "status": "Критическая ошибка", "reward": "—"}
-        results.append(res)
+            logger.warning(f"({res.address}) Не удалось прочитать журнал: {e}")
 
-        if idx < total - 1:
-            delay = random.randint(DELAY_MIN, DELAY_MAX)
-            logger.info(f"Пауза {delay} сек до следующего кошелька...")
-            time.sleep(delay)
+def run_confirm_safe(res, confirm, metrics):
+    """Фоновая сверка deferred-спина; её фазы дописываются в замеры кошелька (total_sec — без неё)."""
+    token = _current_metrics.set(metrics)
+    try:
+        confirm()
+    except Exception as e:
+        logger.exception(f"({res.address}) Сверка спина не удалась: {e}")
+        res.reward = "Не сверено"
+    finally:
+        _current_metrics.reset(token)
+    res.confirm = None
+    res.metrics = metrics.as_dict()
+    _attach_txs(res)
+    return res
+
+async def run_wallets_async(private_keys, proxies, concurrency=CONCURRENCY, on_result=None, total=None):
+    """Прогоняет кошельки через пул из `concurrency` воркеров.
+
+    private_keys — список или ленивый итератор (iter_lines): ключи читаются порциями
+    по мере освобождения воркеров, для каждой порции заранее одним batch-запросом
+    подтягиваются nonce/балансы. Шаги одного кошелька идут строго по порядку в своём
+    потоке. on_result(idx, res) вызывается по готовности каждого кошелька; без него
+    функция возвращает список результатов в порядке ключей.
+    """
+    if total is None and hasattr(private_keys, "__len__"):
+        total = len(private_keys)
+    if total == 0:
+        return []
+    loop = asyncio.get_running_loop()
+    workers = max(1, concurrency if total is None else min(concurrency, total))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wallet")
+    confirm_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="confirm")
+
+    global _proxy_pool
+    _proxy_pool = ProxyPool(proxies)
+    await loop.run_in_executor(None, _proxy_pool.check_all)
+    try:
+        prefetch_session = make_session(_proxy_pool.acquire(0))
+    except LookupError:
+        prefetch_session = None
+
+    chunk_size = max(1, min(RPC_BATCH_SIZE, workers * 4))
+    queue = asyncio.Queue(maxsize=chunk_size * 2)
+    collected = []
+    confirms = set()
+
+    def deliver(idx, res):
+        if on_result is not None:
+            on_result(idx, res)
+        else:
+            collected.append((idx, res))
+        release_wallet(res.address)
+
+    async def confirm(idx, res):
+        await loop.run_in_executor(confirm_executor, res.confirm)
+        deliver(idx, res)
+
+    def prefetch(chunk):
+        addresses = []
+        for _, pk in chunk:
+            try:
+                addresses.append(address_of(pk))
+            except Exception:
+                pass  # битый ключ — его ошибку покажет run_wallet_safe по этому кошельку
+        get_nonce_manager().prefetch(prefetch_session, addresses)
+
+    async def producer():
+        chunk = []
+        for idx, pk in enumerate(private_keys):
+            chunk.append((idx, pk))
+            if len(chunk) < chunk_size:
+                continue
+            if prefetch_session is not None:
+                await loop.run_in_executor(None, prefetch, chunk)
+            for item in chunk:
+                await queue.put(item)
+            chunk = []
+        if chunk and prefetch_session is not None:
+            await loop.run_in_executor(None, prefetch, chunk)
+        for item in chunk:
+            await queue.put(item)
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def worker():
+        first = True
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            if not first:
+                delay = random.randint(DELAY_MIN, DELAY_MAX)
+                logger.info(f"Пауза {delay} сек до следующего кошелька...")
+                await asyncio.sleep(delay)
+            first = False
+            idx, pk = item
+            res = await loop.run_in_executor(executor, run_wallet_safe, pk, _proxy_pool, idx, total)
+            if res.confirm is not None:
+                task = asyncio.ensure_future(confirm(idx, res))
+                confirms.add(task)
+                task.add_done_callback(confirms.discard)
+            else:
+                deliver(idx, res)
 
-    # Таблица итогов
+    try:
+        await asyncio.gather(producer(), *(worker() for _ in range(workers)))
+        if confirms:
+            logger.info(f"Ждём фоновую сверку {len(confirms)} спинов...")
+            await asyncio.gather(*confirms)
+    finally:
+        executor.shutdown(wait=True)
+        confirm_executor.shutdown(wait=True)
+    if on_result is None:
+        return [res for _, res in sorted(collected, key=lambda x: x[0])]
+
+# ===== Шардирование по процессам =====
+def _settings_snapshot():
+    """Текущие настройки модуля (КАПСОМ) — spawn-процесс иначе увидит только значения из файла."""
+    return {k: v for k, v in globals().items()
+            if k.isupper() and isinstance(v, (int, float, str, bool, list, tuple, dict))}
+
+def _shard_worker(shard, shards, keys_file, proxies, concurrency, total, out_queue, settings=None):
+    """Процесс-шард: ключи с idx % shards == shard (читаются из файла сам) и своя часть прокси."""
+    global RATE_LIMITS, RATE_BURST
+    globals().update(settings or {})
+    # лимитеры у каждого процесса свои — делим общий лимит, чтобы шарды вместе его не превышали
+    RATE_LIMITS = {group: rate / shards for group, rate in RATE_LIMITS.items()}
+    RATE_BURST = max(1, RATE_BURST // shards)
+    setup_logging(f"spin_linea.shard{shard}.log")
+    my_keys = (pk for i, pk in enumerate(iter_lines(keys_file)) if i % shards == shard)
+    my_proxies = proxies[shard::shards] if len(proxies) >= shards else proxies
+    my_total = len(range(shard, total, shards))
+    try:
+        asyncio.run(run_wallets_async(my_keys, my_proxies, concurrency, total=my_total,
+                                      on_result=lambda i, res: out_queue.put(("result", i * shards + shard, res))))
+    finally:
+        logger.complete()
+        out_queue.put(("exit", shard, None))
+
+def run_sharded(keys_file, proxies, on_result, shards=SHARDS, concurrency=CONCURRENCY, total=None):
+    """Делит ключи между `shards` процессами; результаты приходят в on_result по мере готовности."""
+    total = count_lines(keys_file) if total is None else total
+    shards = max(1, min(shards, total))
+    ctx = multiprocessing.get_context("spawn")
+    out_queue = ctx.Queue()
+    procs = [ctx.Process(target=_shard_worker, name=f"shard{k}",
+                         args=(k, shards, keys_file, proxies, concurrency, total, out_queue,
+                               _settings_snapshot()))
+             for k in range(shards)]
+    for p in procs:
+        p.start()
+    logger.info(f"Запущено шардов: {shards} (по ~{total // shards} кошельков, concurrency {concurrency})")
+
+    seen = bytearray(total)
+    running = shards
+    while running:
+        try:
+            kind, key, res = out_queue.get(timeout=5)
+        except Exception:
+            if not any(p.is_alive() for p in procs) and out_queue.empty():
+                break  # шард умер, не успев попрощаться
+            continue
+        if kind == "result":
+            seen[key] = 1
+            on_result(key, res)
+        else:
+            running -= 1
+    for p in procs:
+        p.join()
+
+    for idx in range(total):
+        if not seen[idx]:
+            logger.error(f"(idx={idx}) Шард не вернул результат")
+            on_result(idx, WalletResult(status="Критическая ошибка"))
+
+# ===== Итоги =====
+SUMMARY_TABLE_MAX       = 200                # строк в итоговой таблице; полный список — в results.csv
+RUN_REPORT_WALLETS_FILE = "run_report.jsonl"  # замеры по кошелькам, по строке на кошелёк
+
+class RunCollector:
+    """Принимает результаты по мере готовности и сразу пишет их на диск.
+
+    Строка прогона уходит в историю (history.db) сразу по готовности. results.csv
+    пишется в порядке ключей (обогнавшие результаты ждут в небольшом буфере) или,
+    при ordered=False (--daemon, где кошельки идут в порядке серий), тоже сразу;
+    замеры по кошелькам — в run_report.jsonl. В памяти остаются только агрегаты
+    (времена фаз в array('d')) и первые SUMMARY_TABLE_MAX строк для таблицы.
+    """
+
+    def __init__(self, csv_path="results.csv", wallets_path=None, table_max=None, history=None,
+                 ordered=True):
+        self.csv_path = csv_path
+        self.ordered = ordered
+        self.wallets_path = wallets_path or RUN_REPORT_WALLETS_FILE
+        self.table_max = SUMMARY_TABLE_MAX if table_max is None else table_max
+        self.table_rows = []
+        self.count = 0
+        self.statuses = Counter()
+        self._phase_times = {}
+        self._wallet_times = array("d")
+        self._requests = Counter()
+        self._retries = Counter()
+        self._pending = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self._csv_f = open(self.csv_path, "w", newline="", encoding="utf-8")
+        self._csv = csv.writer(self._csv_f)
+        self._csv.writerow(["address", "streak", "status", "reward"])
+        self._wallets_f = open(self.wallets_path, "w", encoding="utf-8")
+        self._history = history or get_history_store()
+        self._run_id = self._history.start_run()
+
+    def add(self, idx, res):
+        try:
+            self._history.add(self._run_id, res)
+        except Exception as e:
+            logger.warning(f"({res.address}) Не удалось записать историю: {e}")
+        with self._lock:
+            if not self.ordered:
+                self._write(idx, res)
+                return
+            self._pending[idx] = res
+            while self._next in self._pending:
+                self._write(self._next, self._pending.pop(self._next))
+                self._next += 1
+
+    def _write(self, idx, r):
+        self._csv.writerow([r.address, r.streak if r.streak is not None else "", r.status, r.reward])
+        self._csv_f.flush()
+        m = r.metrics
+        if m is not None:
+            self._wallets_f.write(json.dumps({"idx": idx, **r.as_row(), **m}, ensure_ascii=False) + "\n")
+            self._wallet_times.append(m["total_sec"])
+            for name, p in m["phases"].items():
+                self._phase_times.setdefault(name, array("d")).append(p["sec"])
+            self._requests.update(m["requests"])
+            self._retries.update(m["retries"])
+            r.metrics = None
+        self.count += 1
+        self.statuses[r.status] += 1
+        if len(self.table_rows) < self.table_max:
+            self.table_rows.append(r)
+
+    def close(self, elapsed):
+        """Дописывает хвост (если какой-то idx так и не пришёл) и возвращает агрегированный отчёт."""
+        with self._lock:
+            for idx in sorted(self._pending):
+                self._write(idx, self._pending.pop(idx))
+            self._csv_f.close()
+            self._wallets_f.close()
+            self._history.finish_run(self._run_id, self.count, elapsed)
+        logger.info(f"Итог сохранён в {self.csv_path}")
+
+        def pct(values, q):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(q / 100 * len(values)))] if values else 0.0
+
+        phases = {}
+        for name, times in self._phase_times.items():
+            phases[name] = {"total_sec": round(sum(times), 3), "mean_sec": round(sum(times) / len(times), 3),
+                            "p95_sec": round(pct(times, 95), 3), "wallets": len(times)}
+        summary = {"wallets": self.count,
+                   "elapsed_sec": round(elapsed, 3),
+                   "wallets_per_min": round(self.count / elapsed * 60, 2) if elapsed else None,
+                   "wallet_p50_sec": round(pct(self._wallet_times, 50), 3),
+                   "wallet_p99_sec": round(pct(self._wallet_times, 99), 3),
+                   "requests": sum(self._requests.values()),
+                   "retries": sum(self._retries.values()),
+                   "statuses": dict(self.statuses)}
+        return {"generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "summary": summary, "phases": phases,
+                "requests": dict(self._requests.most_common()), "retries": dict(self._retries),
+                "wallets_file": self.wallets_path}
+
+def print_results(results, total=None):
     rows = []
     for r in results:
-        addr = r["address"]
-        streak = r["streak"]
-        streak_str = (f"{streak} дн." if isinstance(streak, int) else "-")
-        rows.append([addr, streak_str, r["status"], r["reward"]])
+        streak_str = (f"{r.streak} дн." if isinstance(r.streak, int) else "-")
+        rows.append([r.address, streak_str, r.status, r.reward])
 
     print("\nИТОГИ:")
     print(tabulate(rows, headers=["Кошелёк", "Streak", "Статус", "Награды"], tablefmt="fancy_grid"))
+    if total is not None and total > len(rows):
+        print(f"Показаны первые {len(rows)} из {total}; полный список — в results.csv")
+
+def print_run_summary(report):
+    sm = report["summary"]
+    rows = [[name, p["total_sec"], p["mean_sec"], p["p95_sec"], p["wallets"]]
+            for name, p in sorted(report["phases"].items(), key=lambda kv: -kv[1]["total_sec"])]
+    print(f"\nЗАМЕРЫ: {sm['wallets']} кошельков за {sm['elapsed_sec']} c "
+          f"({sm['wallets_per_min']} / мин), p50 {sm['wallet_p50_sec']} c, p99 {sm['wallet_p99_sec']} c, "
+          f"запросов {sm['requests']}, ретраев {sm['retries']}")
+    print(tabulate(rows, headers=["Фаза", "Всего, c", "Среднее, c", "p95, c", "Кошельков"],
+                   tablefmt="fancy_grid"))
+    for name, st in (report.get("rate_limits") or {}).items():
+        print(f"Лимит {name}: {st['limit_rps']}/{st['max_rps']} запр/с, сейчас {st['current_rps']}, "
+              f"429 получено {st['throttled']}")
+
+def save_run_report(report, fname=None):
+    fname = fname or RUN_REPORT_FILE
+    try:
+        with open(fname, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"Отчёт о прогоне сохранён в {fname}")
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить {fname}: {e}")
+
+def build_history_report(days=30, top=10, history=None):
+    """Аналитика по history.db за последние `days` суток — только SQL-агрегаты, без сети."""
+    history = history or get_history_store()
+    since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    # последний прогон кошелька за сутки — его итог (повторные запуски берут «done» из журнала)
+    last = """WITH last AS (
+                  SELECT w.* FROM wallet_runs w
+                  JOIN (SELECT address, day, MAX(run_id) AS run_id FROM wallet_runs
+                        WHERE day >= ? GROUP BY address, day) m USING (address, day, run_id))"""
+    by_day = history.query(f"""{last}
+        SELECT l.day, COUNT(*), SUM(l.status = 'Вращено'),
+               COALESCE(t.txs, 0), COALESCE(t.eth, 0.0), COALESCE(t.prizes, 0)
+        FROM last l
+        LEFT JOIN (SELECT day, COUNT(*) AS txs, TOTAL(gas_used * 1.0 * gas_price) / 1e18 AS eth,
+                          SUM(n_prizes) AS prizes
+                   FROM txs WHERE day >= ? GROUP BY day) t USING (day)
+        GROUP BY l.day ORDER BY l.day""", (since, since))
+    statuses = history.query(f"{last} SELECT status, COUNT(*) FROM last GROUP BY status ORDER BY 2 DESC", (since,))
+    totals = history.query("""SELECT COUNT(*), TOTAL(gas_used * 1.0 * gas_price) / 1e18, TOTAL(n_prizes),
+                                     TOTAL(status = 0)
+                              FROM txs WHERE day >= ?""", (since,))[0]
+    streaks = history.query("""
+        WITH daily AS (SELECT address, day, MAX(streak) AS streak FROM wallet_runs
+                       WHERE day >= ? AND streak IS NOT NULL GROUP BY address, day),
+             seq AS (SELECT streak, LAG(streak) OVER (PARTITION BY address ORDER BY day) AS prev FROM daily)
+        SELECT TOTAL(prev > 0), TOTAL(prev > 0 AND streak < prev), AVG(streak) FROM seq""", (since,))[0]
+    slowest = history.query("""SELECT address, COUNT(*), AVG(total_sec), MAX(total_sec) FROM wallet_runs
+                               WHERE day >= ? AND total_sec IS NOT NULL
+                               GROUP BY address ORDER BY AVG(total_sec) DESC LIMIT ?""", (since, top))
+
+    txs, eth, prizes, failed = totals
+    checked, broken, avg_streak = streaks
+    return {"since": since, "days": days,
+            "summary": {"txs": txs, "failed_txs": int(failed), "eth_spent": round(eth, 8),
+                        "prizes": int(prizes), "eth_per_prize": round(eth / prizes, 8) if prizes else None,
+                        "streak_days_checked": int(checked),
+                        "streak_break_rate": round(broken / checked, 4) if checked else None,
+                        "avg_streak": round(avg_streak, 2) if avg_streak is not None else None},
+            "by_day": [{"day": d, "wallets": w, "spun": sp, "txs": t, "eth_spent": round(e, 8), "prizes": p}
+                       for d, w, sp, t, e, p in by_day],
+            "statuses": dict(statuses),
+            "slowest": [{"address": a, "runs": n, "avg_sec": round(avg, 2), "max_sec": round(mx, 2)}
+                        for a, n, avg, mx in slowest]}
+
+def print_history_report(rep):
+    sm = rep["summary"]
+    print(f"\nИСТОРИЯ с {rep['since']} ({rep['days']} сут.): tx {sm['txs']} (упало {sm['failed_txs']}), "
+          f"газ {sm['eth_spent']} ETH, призов {sm['prizes']}, ETH на приз {sm['eth_per_prize']}")
+    print(f"Серии: средняя {sm['avg_streak']}, обрывы {sm['streak_break_rate']} "
+          f"(из {sm['streak_days_checked']} переходов день→день)")
+    print(tabulate([[d["day"], d["wallets"], d["spun"], d["txs"], d["eth_spent"], d["prizes"]]
+                    for d in rep["by_day"]],
+                   headers=["День", "Кошельков", "Вращено", "Tx", "Газ, ETH", "Призов"], tablefmt="fancy_grid"))
+    print(tabulate(sorted(rep["statuses"].items(), key=lambda kv: -kv[1]),
+                   headers=["Статус", "Кошелёко-дней"], tablefmt="simple"))
+    print("\nСамые медленные кошельки:")
+    print(tabulate([[x["address"], x["runs"], x["avg_sec"], x["max_sec"]] for x in rep["slowest"]],
+                   headers=["Кошелёк", "Прогонов", "Среднее, c", "Макс, c"], tablefmt="simple"))
+
+def _read_local_db(path, sql):
+    """{address: остаток строки} из локальной SQLite-базы (только чтение); {} — если базы ещё нет."""
+    if not os.path.exists(path):
+        return {}
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+    try:
+        return {row[0]: row[1:] for row in conn.execute(sql)}
+    except sqlite3.Error:
+        return {}
+    finally:
+        conn.close()
+
+def planned_proxy(idx, proxies, shards):
+    """(шард, прокси) кошелька idx — та же раскладка, что у run_sharded и ProxyPool.acquire."""
+    shard, local, mine = idx % shards, idx // shards, proxies
+    if shards > 1 and len(proxies) >= shards:
+        mine = proxies[shard::shards]
+    return shard, (mine[local % len(mine)] if mine else None)
+
+def plan_run(shards=SHARDS, table_max=None):
+    """--plan: кошельки, их шарды и прокси и что о них известно локально — без сети и без web3."""
+    t0 = time.perf_counter()
+    table_max = SUMMARY_TABLE_MAX if table_max is None else table_max
+    proxies = read_lines(PROXIES_FILE) if os.path.exists(PROXIES_FILE) else []
+    tokens = _read_local_db(TOKEN_CACHE_FILE, "SELECT address, exp FROM tokens")
+    journal = get_journal()
+    prizes = _read_local_db(PRIZE_DB_FILE, "SELECT address, COUNT(*) FROM prizes GROUP BY address")
+    history = _read_local_db(HISTORY_DB_FILE, """SELECT address, status, streak, MAX(run_id)
+                                                 FROM wallet_runs GROUP BY address""")
+    total = count_lines(KEYS_FILE)
+    shards = max(1, min(shards, total or 1))
+
+    rows, phases, per_proxy, with_token, invalid = [], Counter(), Counter(), 0, 0
+    now = time.time()
+    for idx, pk in enumerate(iter_lines(KEYS_FILE)):
+        shard, proxy = planned_proxy(idx, proxies, shards)
+        per_proxy[proxy] += 1
+        try:
+            address = address_of(pk)
+        except Exception:
+            invalid += 1
+            if len(rows) < table_max:
+                rows.append([idx + 1, "неверный ключ", shard if shards > 1 else "", proxy or "—",
+                             "—", "—", "—", "—", "—"])
+            continue
+        key = address.lower()
+        exp = tokens.get(key, (None,))[0]
+        alive = exp is not None and exp - now > TOKEN_CACHE_MIN_TTL
+        with_token += alive
+        st = journal.state(address)
+        ph = st.get("phase") or "—"
+        phases[ph] += 1
+        if len(rows) < table_max:
+            last_status, last_streak, _ = history.get(key, (None, None, None))
+            rows.append([idx + 1, address, shard if shards > 1 else "", proxy or "—",
+                         datetime.fromtimestamp(exp).strftime("до %H:%M") if alive else "—",
+                         (st.get("result") or {}).get("status", ph) if ph == "done" else ph,
+                         prizes.get(key, (0,))[0], last_status or "—",
+                         last_streak if last_streak is not None else "—"])
+    save_address_cache()
+
+    print(tabulate(rows, headers=["#", "Кошелёк", "Шард", "Прокси", "Токен", "Сегодня", "Призов",
+                                  "Прошлый итог", "Серия"], tablefmt="fancy_grid"))
+    if total > len(rows):
+        print(f"Показаны первые {len(rows)} из {total}")
+    print(f"\nКошельков: {total}, шардов: {shards}, прокси: {len(proxies) or 'без прокси'} "
+          f"(на прокси до {max(per_proxy.values(), default=0)} кошельков)")
+    print(f"Живой токен в кэше: {with_token} из {total} — им не нужен handshake")
+    if invalid:
+        print(f"Неверных ключей: {invalid} — эти кошельки завершатся ошибкой")
+    print(f"Сегодня по журналу: {phases.get('done', 0)} готово (будут пропущены), "
+          f"{phases.get('tx_sent', 0) + phases.get('receipt', 0)} с неподтверждённой tx, "
+          f"{phases.get('—', 0)} ещё не начаты")
+    print(f"План построен за {time.perf_counter() - t0:.2f} c, "
+          f"web3 {'загружен' if Account is not None else 'не загружался'}")
+
+def finish_run(collector, elapsed):
+    """Закрывает прогон: таблица итогов, замеры и run_report.json (results.csv уже записан по ходу)."""
+    report = collector.close(elapsed)
+    report["rate_limits"] = rate_limit_stats()
+    save_address_cache()
+    print_results(collector.table_rows, collector.count)
+    print_run_summary(report)
+    save_run_report(report)
+    return report
+
+# ===== Планировщик (--daemon) =====
+def streak_priority(streak):
+    """Ключ порядка на день (меньше — раньше): чем длиннее серия, тем больше теряем при пропуске
+    (множители за 7 и 30 дней), поэтому такие кошельки идут первыми; неизвестная серия — как 0."""
+    return -streak if isinstance(streak, int) else 0
+
+def probe_streaks(private_keys, proxy_pool, workers):
+    """Серии кошельков с кэшированным токеном (без handshake) — для порядка в первый день."""
+    def probe(item):
+        idx, pk = item
+        try:
+            tokens = get_cached_tokens(address_of(pk))
+            if not tokens:
+                return idx, None
+            session = make_session(proxy_pool.acquire(idx))
+            return idx, get_streak(session, tokens.get("jwt") or tokens.get("minifiedJwt"))
+        except Exception as e:
+            logger.debug(f"(idx={idx}) Серию узнать не удалось: {e}")
+            return idx, None
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="probe") as ex:
+        streaks = {idx: st for idx, st in ex.map(probe, enumerate(private_keys)) if isinstance(st, int)}
+    logger.info(f"Серии известны для {len(streaks)} из {len(private_keys)} кошельков")
+    return streaks
+
+def day_bounds():
+    """(начало текущих UTC-суток, начало следующих) в unix-секундах."""
+    start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    return start, start + 86400
 
-    # (опционально) Сохранить CSV
+def _daemon_wallet(pk, idx, total):
+    """Кошелёк в режиме планировщика: свежие nonce/баланс (за сутки могли уйти), спин и сверка."""
     try:
-        import csv
-        with open("results.csv", "w", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            w.writerow(["address", "streak", "status", "reward"])
-            for r in results:
-                w.writerow([r["address"],
-                            r["streak"] if r["streak"] is not None else "",
-                            r["status"], r["reward"]])
-        logger.info("Итог сохранён в results.csv")
+        get_nonce_manager().prefetch(make_session(_proxy_pool.acquire(idx)), [address_of(pk)])
+    except LookupError:
+        pass  # прокси нет — run_wallet_safe вернёт «Прокси ошибка» (и кошелёк уйдёт на повтор)
     except Exception as e:
-        logger.warning(f"Не удалось сохранить results.csv: {e}")
+        # битый ключ: ошибку по этому кошельку вернёт run_wallet_safe
+        logger.debug(f"(idx={idx}) Предзагрузка nonce/баланса не удалась: {e}")
+    res = run_wallet_safe(pk, _proxy_pool, idx, total)
+    if res.confirm is not None:
+        res.confirm()
+    return res
+
+async def _daemon_day(loop, executor, private_keys, streaks, concurrency, window_end, day_end):
+    total = len(private_keys)
+    order = sorted(range(total), key=lambda i: (streak_priority(streaks.get(i)), i))
+    now = time.time()
+    step = max(0.0, window_end - now) / max(1, total)
+    heap = [(now + k * step + random.uniform(0, step), idx, 0) for k, idx in enumerate(order)]
+    heapq.heapify(heap)
+    logger.info(f"Сутки {utc_day()}: {total} кошельков до "
+                f"{datetime.fromtimestamp(max(now, window_end), timezone.utc):%H:%M} UTC, шаг ~{step:.0f} с")
+
+    collector = RunCollector(ordered=False)
+    t_start = time.perf_counter()
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+
+    async def job(idx, attempt):
+        try:
+            res = await loop.run_in_executor(executor, _daemon_wallet, private_keys[idx], idx, total)
+        finally:
+            slots.release()
+        if res.retryable and attempt < DAEMON_RETRY_MAX:
+            run_at = time.time() + backoff_delay(attempt + 1, DAEMON_RETRY_BASE, 3600)
+            if run_at < day_end:
+                logger.warning(f"(idx={idx}) {res.status} — повтор #{attempt + 1} через {run_at - time.time():.0f} с")
+                heapq.heappush(heap, (run_at, idx, attempt + 1))
+                return
+        if isinstance(res.streak, int):
+            streaks[idx] = res.streak
+        collector.add(idx, res)
+        release_wallet(res.address)
+
+    try:
+        while heap or running:
+            if heap and heap[0][0] <= time.time():
+                await slots.acquire()
+                _, idx, attempt = heapq.heappop(heap)
+                task = asyncio.ensure_future(job(idx, attempt))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                continue
+            # ждём ближайший слот по расписанию или завершения кошелька (он мог вернуться в очередь)
+            timeout = min(60.0, heap[0][0] - time.time()) if heap else None
+            if running:
+                await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(max(0.0, timeout))
+    finally:
+        # и при Ctrl-C посреди суток: итог по обработанным кошелькам и запись прогона в историю
+        finish_run(collector, time.perf_counter() - t_start)
+
+async def run_daemon(private_keys, proxies, concurrency=CONCURRENCY, window_hours=None):
+    """Долгоживущий режим: каждые UTC-сутки раскидывает кошельки по окну спинов.
+
+    Кэши (токены, здоровье прокси, контракт и газ, трекер) живут между сутками. Порядок —
+    по риску потерять серию; упавшие кошельки возвращаются в очередь с backoff до конца суток.
+    """
+    loop = asyncio.get_running_loop()
+    window = (DAEMON_WINDOW_HOURS if window_hours is None else window_hours) * 3600
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="wallet")
+
+    global _proxy_pool
+    _proxy_pool = ProxyPool(proxies)
+    await loop.run_in_executor(None, _proxy_pool.check_all)
+    streaks = await loop.run_in_executor(None, probe_streaks, private_keys, _proxy_pool, concurrency)
+    try:
+        while True:
+            day_start, day_end = day_bounds()
+            await _daemon_day(loop, executor, private_keys, streaks, concurrency, day_start + window, day_end)
+            pause = max(0.0, day_end - time.time()) + random.uniform(30, 300)
+            logger.info(f"Сутки обработаны, следующий проход через {pause / 3600:.1f} ч")
+            await asyncio.sleep(pause)
+    finally:
+        executor.shutdown(wait=True)
+
+# ======== MAIN ========
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Linea Spin: ежедневные спины по кошелькам из private_keys.txt")
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY,
+                    help="кошельков одновременно (в каждом процессе)")
+    ap.add_argument("--shards", type=int, default=SHARDS,
+                    help="число процессов; ключи и прокси делятся между ними")
+    ap.add_argument("--confirm", choices=("inline", "deferred"), default=PRIZE_CONFIRM,
+                    help="deferred — не ждать индексатор: призы (и доп. спины) — после фоновой сверки")
+    ap.add_argument("--daemon", action="store_true",
+                    help="не выходить: каждые сутки раскидывать кошельки по окну --window-hours")
+    ap.add_argument("--window-hours", type=float, default=DAEMON_WINDOW_HOURS)
+    ap.add_argument("--plan", action="store_true",
+                    help="только план: кошельки, шарды, прокси и локальное состояние — без сети, мгновенно")
+    ap.add_argument("--report", action="store_true",
+                    help="только отчёт по history.db (газ на приз, обрывы серий, медленные кошельки), без сети")
+    ap.add_argument("--days", type=int, default=30, help="за сколько суток считать --report")
+    ap.add_argument("--log-level", default=LOG_LEVEL, help="DEBUG — с сырыми ответами API; WARNING — только проблемы")
+    ap.add_argument("--log-format", choices=("text", "json"), default=LOG_FORMAT)
+    args = ap.parse_args()
+    PRIZE_CONFIRM = args.confirm
+    LOG_LEVEL, LOG_FORMAT = args.log_level.upper(), args.log_format
+
+    setup_logging()
+
+    if args.plan:
+        plan_run(shards=args.shards)
+    elif args.report:
+        print_history_report(build_history_report(days=args.days))
+    elif args.daemon:
+        proxies = read_lines(PROXIES_FILE)
+        if args.shards > 1:
+            logger.warning("--shards в режиме --daemon не поддерживается — работаем одним процессом")
+        try:
+            asyncio.run(run_daemon(read_lines(KEYS_FILE), proxies, args.concurrency, args.window_hours))
+        except KeyboardInterrupt:
+            logger.info("Планировщик остановлен.")
+    else:
+        proxies = read_lines(PROXIES_FILE)
+        total = count_lines(KEYS_FILE)
+        collector = RunCollector()
+        t_start = time.perf_counter()
+        if args.shards > 1:
+            run_sharded(KEYS_FILE, proxies, collector.add, shards=args.shards,
+                        concurrency=args.concurrency, total=total)
+        else:
+            asyncio.run(run_wallets_async(iter_lines(KEYS_FILE), proxies, concurrency=args.concurrency,
+                                          on_result=collector.add, total=total))
+        finish_run(collector, time.perf_counter() - t_start)
+    logger.complete()